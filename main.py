@@ -6,13 +6,38 @@
 # - 支持选择字段的实时 CSV 导出
 # - 定时采集与倒计时显示
 # - 设置项与已查询城市状态持久化
+#
+# 启动耗时：python main.py --profile-startup 在省份列表构建完成后打印各阶段耗时。
+
+import sys
+import time
+
+# 启动计时点 [(阶段, perf_counter)]，--profile-startup 时在启动完成后打印
+_STARTUP_MARKS = [("进程启动", time.perf_counter())]
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+
+
+def mark_startup(label):
+    """记录一个启动阶段的结束时刻。"""
+    _STARTUP_MARKS.append((label, time.perf_counter()))
+
+
+def report_startup_profile():
+    """打印各启动阶段耗时（毫秒）与累计耗时。"""
+    start = previous = _STARTUP_MARKS[0][1]
+    print("启动耗时（--profile-startup）：")
+    for label, moment in _STARTUP_MARKS[1:]:
+        print(f"  {label:<12}{(moment - previous) * 1000:8.1f} ms   累计 {(moment - start) * 1000:8.1f} ms")
+        previous = moment
+    print("  各模块导入耗时明细可用：python -X importtime main.py --profile-startup")
 
 
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox, filedialog
 import os
-import sys
+
+mark_startup("导入 tkinter")
 
 def show_centered_message(title, message, message_type="info", parent_window=None):
     """显示居中的消息框"""
@@ -171,276 +196,65 @@ def show_centered_message(title, message, message_type="info", parent_window=Non
                 return messagebox.askyesnocancel(title, message)
             else:  # info
                 return messagebox.showinfo(title, message)
-import requests
 import threading
-import csv
 import os
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import time
-import webbrowser
-import json
+import queue
+import logging
+from logging.handlers import RotatingFileHandler
+from collections import deque
+import itertools
+import sqlite3
 from datetime import datetime, timedelta  # 日期时间与时间间隔处理
-import configparser
+# 网络（requests）、导出（csv）与浏览器（webbrowser）模块在首次使用时才导入，缩短冷启动时间
 
+from mapsearch.core import (
+    POI_FIELDS, ApiKeyPool, ConfigManager, CrawlEngine, CsvSink, PoiStore, ResponseCache, TaskQueue,
+    create_crawl_engine, parse_region_tree, poi_to_csv_row, resource_path, split_keywords,
+)
 
-class ConfigManager:
-    """统一配置文件管理类"""
-    
-    def __init__(self, config_file='config.json'):
-        self.config_file = config_file
-        self.config = self._load_default_config()
-        self.load_config()
-    
-    def _load_default_config(self):
-        """返回默认配置结构"""
-        return {
-            "metadata": {
-                "version": "1.0",
-                "created_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                "last_updated": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                "total_provinces": 0,
-                "total_cities": 0,
-                "description": "MapSearch配置文件"
-            },
-            "user_settings": {
-                "api_keys": "",
-                "keywords": "",
-                "all_provinces": False,
-                "realtime_export": True,
-                "realtime_export_path": "商家信息.csv",
-                "auto_collect": False,
-                "auto_collect_times": "6:00 18:00 24:00"
-            },
-            "field_settings": {
-                "ID": False,
-                "名称": True,
-                "类型": False,
-                "电话": True,
-                "网址": False,
-                "邮箱": False,
-                "省份": True,
-                "城市": True,
-                "区域": True,
-                "地址": True,
-                "类型编码": False,
-                "经纬度": False,
-                "入口经纬度": False,
-                "出口经纬度": False
-            },
-            "provinces": {}
-        }
-    
-    def load_config(self):
-        """从JSON文件加载配置，如果文件不存在则使用默认配置"""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    loaded_config = json.load(f)
-                    # 合并配置，确保新字段不丢失
-                    self._merge_config(loaded_config)
-                print(f"已加载配置文件: {self.config_file}")
+mark_startup("导入其余模块")
+
+
+class UiUpdateQueue:
+    """线程安全的界面更新队列：后台线程只投递，主线程按固定节拍一次性取出并批量应用。
+
+    - 日志行按面板分组累积；
+    - 结果行与其他界面操作按投递顺序保存，相邻的结果行合并为一批；
+    - 进度只保留最新一次。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []  # [('rows', [row, ...]) | ('call', fn), ...]
+        self._logs = []  # [(frame, text), ...]
+        self._progress = None
+
+    def post_log(self, frame, text):
+        with self._lock:
+            self._logs.append((frame, text))
+
+    def post_rows(self, rows):
+        with self._lock:
+            if self._events and self._events[-1][0] == 'rows':
+                self._events[-1][1].extend(rows)
             else:
-                print(f"配置文件不存在，使用默认配置: {self.config_file}")
-        except Exception as e:
-            print(f"加载配置文件失败: {e}，使用默认配置")
-    
-    def _merge_config(self, loaded_config):
-        """合并加载的配置和默认配置"""
-        for section, values in loaded_config.items():
-            if section in self.config:
-                if isinstance(values, dict):
-                    self.config[section].update(values)
-                else:
-                    self.config[section] = values
-    
-    def save_config(self):
-        """保存当前配置到JSON文件"""
-        try:
-            self.config["metadata"]["last_updated"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=2)
-            print(f"配置已保存到: {self.config_file}")
-            return True
-        except Exception as e:
-            print(f"保存配置失败: {e}")
-            return False
-    
-    def get_user_settings(self):
-        """获取用户设置"""
-        return self.config.get("user_settings", {})
-    
-    def update_user_settings(self, settings):
-        """更新用户设置"""
-        self.config["user_settings"].update(settings)
-    
-    def get_field_settings(self):
-        """获取字段设置"""
-        return self.config.get("field_settings", {})
-    # 
-    def update_field_settings(self, fields):
-        """更新字段设置"""
-        self.config["field_settings"].update(fields)
-    
-    def get_provinces(self):
-        """获取省份数据"""
-        return self.config.get("provinces", {})
-    
-    def get_cities_by_province(self, province_name):
-        """获取指定省份下的所有城市"""
-        provinces = self.config.get("provinces", {})
-        if province_name in provinces:
-            return provinces[province_name].get("cities", {})
-        return {}
-    
-    def get_all_cities(self):
-        """获取所有城市数据（平铺结构）：返回 {city_name: city_code}。"""
-        all_cities = {}
-        provinces = self.config.get("provinces", {})
-        for province_name, province in provinces.items():
-            cities = province.get("cities", {})
-            for city_name, city_data in cities.items():
-                city_code = city_data.get("adcode")
-                if city_name and city_code:
-                    all_cities[city_name] = city_code
-        return all_cities
-
-    def iter_cities(self, province_name):
-        """遍历指定省份下的城市，统一返回 (city_code, city_name)。
-        根据当前配置文件结构：cities = { city_name: { adcode: city_code, ... } }
-        """
-        provinces = self.config.get("provinces", {})
-        province = provinces.get(province_name, {})
-        cities = province.get("cities", {})
-        for city_name, city_data in cities.items():
-            city_code = city_data.get("adcode")
-            if city_name and city_code:
-                yield city_code, city_name
-    
-    def update_provinces_data(self, province_to_cities, city_name_to_adcode):
-        """更新省市数据到配置中，存储为：
-        provinces = {
-            province_name: {
-                "name": province_name,
-                "adcode": province_adcode,
-                "cities": { city_name: { "name": city_name, "adcode": city_adcode, ... } }
-            }
-        }
-        兼容传入的 city_pairs 为 (city_name, city_code) 或 (city_code, city_name)。
-        """
-        # 清空现有的省份数据
-        self.config["provinces"] = {}
-
-        for province_name, city_pairs in province_to_cities.items():
-            # 推导省级 adcode（城市前两位 + 0000）
-            province_adcode = ""
-            if city_pairs:
-                first_a, first_b = city_pairs[0]
-                # 判断哪一个是 code
-                candidate = first_a if (isinstance(first_a, str) and first_a.isdigit()) else first_b
-                if isinstance(candidate, str) and len(candidate) >= 2 and candidate.isdigit():
-                    province_adcode = candidate[:2] + "0000"
-
-            self.config["provinces"][province_name] = {
-                "name": province_name,
-                "adcode": province_adcode,
-                "cities": {}
-            }
+                self._events.append(('rows', list(rows)))
 
-            for a, b in city_pairs:
-                if isinstance(a, str) and a.isdigit():
-                    city_code, city_name = a, b
-                else:
-                    city_name, city_code = a, b
-                self.config["provinces"][province_name]["cities"][city_name] = {
-                    "name": city_name,
-                    "adcode": city_code,
-                    "queried": False,
-                    "last_query_time": None,
-                    "query_count": 0
-                }
-        
-        # 更新统计信息
-        self._update_metadata_counts()
-    
-    def update_city_query_status(self, province_name, city_code, city_name, queried=True):
-        """更新城市查询状态"""
-        if "provinces" not in self.config:
-            self.config["provinces"] = {}
-        
-        if province_name not in self.config["provinces"]:
-            self.config["provinces"][province_name] = {"adcode": "", "cities": {}}
-        
-        if "cities" not in self.config["provinces"][province_name]:
-            self.config["provinces"][province_name]["cities"] = {}
-        
-        # 以城市名为键进行存储，保持 adcode 字段
-        cities = self.config["provinces"][province_name]["cities"]
-        city_data = cities.get(city_name, {
-            "name": city_name,
-            "adcode": city_code,
-            "queried": False,
-            "last_query_time": None,
-            "query_count": 0
-        })
-        
-        if queried:
-            city_data["queried"] = True
-            city_data["last_query_time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            city_data["query_count"] = city_data.get("query_count", 0) + 1
-        else:
-            city_data["queried"] = False
-        self.config["provinces"][province_name]["cities"][city_name] = city_data
-        
-        # 立即持久化到文件
-        try:
-            self.save_config()
-        except Exception:
-            pass
-    
-    def get_queried_cities(self):
-        """获取已查询城市列表"""
-        queried_cities = []
-        provinces = self.config.get("provinces", {})
-        for province_name, province_data in provinces.items():
-            cities = province_data.get("cities", {})
-            for city_name, city_data in cities.items():
-                if city_data.get("queried", False):
-                    queried_cities.append(city_name)
-        return queried_cities
-    
-    def reset_all_query_status(self):
-        """重置所有城市的查询状态"""
-        provinces = self.config.get("provinces", {})
-        for province_name, province_data in provinces.items():
-            cities = province_data.get("cities", {})
-            for city_name, city_data in cities.items():
-                city_data["queried"] = False
-                city_data["last_query_time"] = None
-                city_data["query_count"] = 0
-    
-    def find_province_by_city_code(self, city_code):
-        """根据城市代码找到所属省份名；兼容不同 cities 结构。未找到返回空字符串。"""
-        provinces = self.config.get("provinces", {})
-        for province_name, province_data in provinces.items():
-            cities = province_data.get("cities", {})
-            # 兼容以代码为键
-            if city_code in cities:
-                return province_name
-            # 兼容以名称为键，值里有 adcode
-            for _, cdata in cities.items():
-                if isinstance(cdata, dict) and cdata.get("adcode") == city_code:
-                    return province_name
-        return ""
-    
-    def _update_metadata_counts(self):
-        """更新元数据中的统计信息"""
-        provinces = self.config.get("provinces", {})
-        total_provinces = len(provinces)
-        total_cities = sum(len(p.get("cities", {})) for p in provinces.values())
-        
-        self.config["metadata"]["total_provinces"] = total_provinces
-        self.config["metadata"]["total_cities"] = total_cities
+    def post_call(self, fn):
+        with self._lock:
+            self._events.append(('call', fn))
+
+    def post_progress(self, fn):
+        with self._lock:
+            self._progress = fn
+
+    def take(self):
+        """取出并清空全部待处理更新，返回 (events, logs, progress)。"""
+        with self._lock:
+            events, self._events = self._events, []
+            logs, self._logs = self._logs, []
+            progress, self._progress = self._progress, None
+        return events, logs, progress
 
 
 class TriStateCheckbutton(tk.Checkbutton):
@@ -643,10 +457,116 @@ class ScrollableFrame(tk.Frame):
     def get_frame(self):
         return self.scrollable_frame
 
+
+class VirtualTable(tk.Frame):
+    """虚拟化结果表：最近 max_rows 行保存在环形缓冲中，Treeview 只保留当前可见的若干行。
+
+    无论累计多少行，控件数量与重绘开销都只与可见行数有关，内存占用不超过 max_rows 行；
+    更早的行仍完整保存在结果库中，导出不受影响。
+    """
+    def __init__(self, container, *args, max_rows=10000, **kwargs):
+        super().__init__(container, *args, **kwargs)
+        self.max_rows = max(1, int(max_rows or 1))
+        self.rows = deque(maxlen=self.max_rows)  # 行模型：每行为与列一一对应的值元组
+        self.columns = []
+        self._offset = 0  # 可见区域第一行在模型中的下标
+        self._visible = 10
+        self._follow = True  # 位于底部时新行到达自动滚动到末尾
+
+        self.tree = ttk.Treeview(self, show='headings', selectmode='browse', height=self._visible)
+        self.v_scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.h_scrollbar = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=self.h_scrollbar.set)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.v_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.h_scrollbar.grid(row=1, column=0, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<Enter>", lambda e: self.tree.bind_all("<MouseWheel>", self._on_mousewheel))
+        self.tree.bind("<Leave>", lambda e: self.tree.unbind_all("<MouseWheel>"))
+
+    def set_columns(self, columns):
+        """设置列标题并清空已有数据。"""
+        self.columns = list(columns)
+        self.tree.configure(columns=self.columns)
+        for name in self.columns:
+            self.tree.heading(name, text=name, anchor='w')
+            self.tree.column(name, width=120, minwidth=60, stretch=True, anchor='w')
+        self.clear()
+
+    def append_rows(self, rows):
+        """追加若干行（超出 max_rows 时丢弃最早的行）；若当前停留在底部则保持跟随到最新行。"""
+        if not rows:
+            return
+        evicted = max(0, len(self.rows) + len(rows) - self.max_rows)
+        self.rows.extend(rows)
+        if self._follow:
+            self._offset = max(0, len(self.rows) - self._visible)
+        else:
+            # 前部的行被挤出后向前平移，保持当前可见的行不跳动
+            self._offset = max(0, self._offset - evicted)
+        self._refresh()
+
+    def clear(self):
+        """清空行模型与显示。"""
+        self.rows.clear()
+        self._offset = 0
+        self._follow = True
+        self._refresh()
+
+    def _row_height(self):
+        try:
+            height = int(ttk.Style().lookup('Treeview', 'rowheight') or 0)
+        except (tk.TclError, ValueError):
+            height = 0
+        return height or 20
+
+    def _on_resize(self, event):
+        # 表头约占一行，其余高度按行高换算为可见行数
+        visible = max(1, event.height // self._row_height() - 1)
+        if visible != self._visible:
+            self._visible = visible
+            self.tree.configure(height=visible)
+            self._scroll_to(self._offset)
+
+    def _scroll_to(self, offset):
+        max_offset = max(0, len(self.rows) - self._visible)
+        self._offset = min(max(0, int(offset)), max_offset)
+        self._follow = self._offset >= max_offset
+        self._refresh()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self._scroll_to(float(args[1]) * len(self.rows))
+        elif args[0] == 'scroll':
+            step = self._visible if args[2] == 'pages' else 1
+            self._scroll_to(self._offset + int(args[1]) * step)
+
+    def _on_mousewheel(self, event):
+        self._scroll_to(self._offset + int(-1*(event.delta/120)) * 3)
+
+    def _refresh(self):
+        """只为可见区域的行创建 Treeview 条目。"""
+        self.tree.delete(*self.tree.get_children())
+        for row in itertools.islice(self.rows, self._offset, self._offset + self._visible):
+            self.tree.insert('', 'end', values=row)
+        total = len(self.rows)
+        if total:
+            self.v_scrollbar.set(self._offset / total, min(1.0, (self._offset + self._visible) / total))
+        else:
+            self.v_scrollbar.set(0, 1)
+
     
 
 class AMapGUI:
     """主界面：执行高德 POI 检索、定时任务与 CSV 导出。"""
+
+    UI_TICK_MS = 80  # 界面更新队列的处理间隔（毫秒）
+    KEYWORD_PLACEHOLDER = "输入检索关键词，多个用逗号分隔"
+
     def __init__(self, root):
         """初始化主窗口、配置管理器、加载初始数据并构建 UI。"""
         self.root = root  # Tk 根窗口
@@ -654,33 +574,56 @@ class AMapGUI:
         
         # 初始化配置管理器
         self.config_manager = ConfigManager()
-        
-        # 从 ConfigManager 加载城市数据（以配置为准）
-        all_cities = self.config_manager.get_all_cities()  # {city_name: city_code}
+        mark_startup("加载配置")
         self.queried_city_names = set(self.config_manager.get_queried_cities())
         
-        # 城市名 -> 复选框变量（用于将来扩展城市多选）
-        self.checked_cities = {city_name: tk.BooleanVar(value=False) for city_name in all_cities.keys()}
         self.is_searching = False  # 标识是否正在检索（控制循环与终止）
         self.is_paused = False  # 标识是否处于暂停状态
-        self.frames = []  # 右侧结果列的 frame 容器列表
+        # 结果分发锁：关闭窗口时先停止接收新页，再写完实时导出队列
+        self._dispatch_lock = threading.Lock()
+        self._closing = False
+        # 后台线程的界面更新统一经队列投递，由主线程按固定节拍批量处理
+        self.ui_updates = UiUpdateQueue()
+        # 查询日志面板只保留最近 log_max_lines 行（环形复用标签），更早的行转存到滚动日志文件
+        settings = self.config_manager.get_user_settings()
+        self.log_max_lines = max(1, int(settings.get('log_max_lines', 500) or 500))
+        # 检索层级：city=按城市，district=细分到区县（约 2800 个更小的区域，不易触及结果上限）
+        self.region_level = 'district' if settings.get('region_level') == 'district' else 'city'
+        self._log_labels = {}  # frame -> deque[tk.Label]
+        self._log_archive = None
         # 初始化复选框容器
         self.city_checkbuttons = {}
         self.province_checkbuttons = {}
         # 省/市数据加载防抖标志
         self.is_loading_province_city = False
         self.create_widgets()
+        mark_startup("构建界面")
         self.load_settings()  
-        # 尝试从本地文件或ConfigManager加载省市数据
-        if not self.load_province_city_data_from_config():
-            print("本地省市数据文件不存在或为空，请点击'加载省/市'按钮从远程加载")
+        mark_startup("加载设置")
+        # 省份列表（数百个控件）在窗口首次绘制之后再构建，窗口先显示出来
+        self.area_hint_label.config(text="正在加载省市数据...")
+        self.root.after(0, lambda: self.root.after_idle(self._build_regions_after_paint))
         self.update_clock()  # 启动定时器
+        self.root.after(self.UI_TICK_MS, self._drain_ui_updates)
+        # 关闭窗口前先停止检索并落盘未保存的查询状态
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         # 初始化进度显示为0
         self.update_progress(0)
         self.root.grid_columnconfigure(1, weight=1)  # 右侧列自适应
         for row_index in range(11):  # 行自适应，防止窗口拉伸错位（扩展以容纳城市文件控件）
             self.root.grid_rowconfigure(row_index, weight=1)
 
+    def _build_regions_after_paint(self):
+        """首次绘制后从配置构建省份列表；启用 --profile-startup 时随后打印启动耗时。"""
+        mark_startup("首次绘制")
+        # 尝试从本地文件或ConfigManager加载省市数据
+        if not self.load_province_city_data_from_config():
+            self.area_hint_label.config(text="未选择城市")
+            print("本地省市数据文件不存在或为空，请点击'加载省/市'按钮从远程加载")
+        mark_startup("构建省份列表")
+        if PROFILE_STARTUP:
+            report_startup_profile()
+
 
     def create_widgets(self):
         """构建窗口的控件、布局与样式（头部、配置、地区、操作、结果）。"""
@@ -798,6 +741,12 @@ class AMapGUI:
                                   font=('Microsoft YaHei UI', 11, 'bold'),
                                   fg='#374151', bg='#ffffff')
         selection_title.pack(side='left')
+
+        # 检索层级：勾选后右侧列出各城市下的区县，按区县检索
+        self.region_level_var = tk.BooleanVar(value=self.region_level == 'district')
+        tk.Checkbutton(title_frame, text="细分到区县", variable=self.region_level_var,
+                       command=self.on_region_level_changed,
+                       bg='#ffffff', relief='flat').pack(side='right')
         
         # 内容区域
         content_frame = tk.Frame(selection_frame, bg='#ffffff')
@@ -901,8 +850,8 @@ class AMapGUI:
         self._attach_mousewheel(self.city_cb_canvas, self.city_cb_canvas)
         self._attach_mousewheel(self.city_cb_frame, self.city_cb_canvas)
 
-        # 构建省份复选框列表
-        self.build_provinces_ui()
+        # 省份复选框列表在窗口首次绘制后由 _build_regions_after_paint 构建
+        self.current_province_name = None
         
     def create_action_card(self, parent):
         """创建操作卡片：查询、停止、导出与辅助操作及进度。"""
@@ -984,7 +933,7 @@ class AMapGUI:
                                             fg='#374151', bg='#ffffff')
         self.queried_cities_label.pack(side='left', padx=(0, 15))
         
-        self.total_cities_label = tk.Label(left_status, text=f"总计: {sum(len(p.get('cities', {})) for p in self.config_manager.get_provinces().values())}", 
+        self.total_cities_label = tk.Label(left_status, text=f"总计: {len(self._all_region_names())}", 
                                           font=('Microsoft YaHei UI', 9),
                                           fg='#374151', bg='#ffffff')
         self.total_cities_label.pack(side='left', padx=(0, 15))
@@ -1148,8 +1097,10 @@ class AMapGUI:
         data_container = tk.Frame(content_frame, bg='white', relief='solid', bd=1, highlightthickness=0)
         data_container.grid(row=1, column=1, sticky='nsew', padx=(5, 5))
         
-        self.table_frame = ScrollableFrame(data_container)
-        self.table_frame.pack(fill='both', expand=True)
+        # 虚拟化结果表：只渲染可见行，内存中只保留最近 results_max_rows 行，大量 POI 时也不会卡顿
+        max_rows = self.config_manager.get_user_settings().get('results_max_rows', 10000)
+        self.results_table = VirtualTable(data_container, bg='white', max_rows=max_rows)
+        self.results_table.pack(fill='both', expand=True)
         
         # 导出字段区域
         fields_label = tk.Label(content_frame, text="导出字段", 
@@ -1185,26 +1136,11 @@ class AMapGUI:
         
         # 创建数据框架
         self.frame1 = self.create_frame(self.message_frame.get_frame())
-        self.frame2 = self.create_frame(self.table_frame.get_frame())
-        self.frame3 = self.create_frame(self.table_frame.get_frame())
         
         # 字段映射
-        self.fields = {
-            "ID": ("id", tk.BooleanVar(value=False)),
-            "名称": ("name", tk.BooleanVar(value=True)),
-            "类型": ("type", tk.BooleanVar(value=False)),
-            "类型编码": ("typecode", tk.BooleanVar(value=False)),
-            "地址": ("address", tk.BooleanVar(value=True)),
-            "经纬度": ("location", tk.BooleanVar(value=False)),
-            "电话": ("tel", tk.BooleanVar(value=True)),
-            "网址": ("website", tk.BooleanVar(value=False)),
-            "邮箱": ("email", tk.BooleanVar(value=False)),
-            "省份": ("pname", tk.BooleanVar(value=False)),
-            "城市": ("cityname", tk.BooleanVar(value=False)),
-            "区域": ("adname", tk.BooleanVar(value=False)),
-            "入口经纬度": ("entr_location", tk.BooleanVar(value=False)),
-            "出口经纬度": ("exit_location", tk.BooleanVar(value=False)),
-        }
+        default_fields = {"名称", "地址", "电话"}
+        self.fields = {chinese: (english, tk.BooleanVar(value=chinese in default_fields))
+                       for chinese, english in POI_FIELDS}
         
         for field in self.fields:
             cb = tk.Checkbutton(self.checkbox_scrollable_frame, text=field, 
@@ -1216,14 +1152,13 @@ class AMapGUI:
             self._attach_mousewheel(cb, self.checkbox_canvas)
             
     def update_progress(self, total_count):
-        """更新进度显示（以配置为准统计已查询城市）。"""
+        """更新进度显示（以配置为准，统计当前关键词下已查询的区域）。"""
         try:
-            provinces = self.config_manager.get_provinces()
-            queried_count = 0
-            for province in provinces.values():
-                for city in province.get('cities', {}).values():
-                    if city.get('queried'):
-                        queried_count += 1
+            # 多个关键词时，区域需在每个关键词下都查询过才计为已查询
+            keywords = self.active_keywords() or [None]
+            queried_count = sum(1 for _, _, record in self.config_manager.iter_region_records(self.region_level)
+                                if all(self.config_manager.is_queried(record.get('adcode'), keyword)
+                                       for keyword in keywords))
 
             if total_count <= 0:
                 if hasattr(self, 'progress_bar'):
@@ -1272,9 +1207,9 @@ class AMapGUI:
                 if hasattr(self, 'total_cities_label'):
                     self.total_cities_label.config(text=f"总计: {total}")
 
-            # 确保在主线程更新 UI
-            if hasattr(self, 'root'):
-                self.root.after(0, _apply)
+            # 确保在主线程更新 UI；同一节拍内只应用最新进度
+            if hasattr(self, 'ui_updates'):
+                self.ui_updates.post_progress(_apply)
             else:
                 _apply()
         except Exception:
@@ -1392,14 +1327,16 @@ class AMapGUI:
     def clear_output(self):
         """清空右侧输出区域和查询日志中的所有条目。"""
         # 清空 POI 数据区域
-        for frame in getattr(self, 'frames', []):
-            for widget in frame.winfo_children():
-                widget.destroy()
-        # 清空 查询日志 区域
+        if hasattr(self, 'results_table'):
+            self.results_table.clear()
+        # 清空 查询日志 区域（面板中剩余的行先转存到日志文件）
         try:
-            log_inner = self.message_frame.get_frame()
-            for widget in log_inner.winfo_children():
-                widget.destroy()
+            # 只销毁日志行本身，保留 frame1 容器以便后续继续写入
+            for labels in self._log_labels.values():
+                for label in labels:
+                    self._archive_log_line(label.cget('text'))
+                    label.destroy()
+            self._log_labels = {}
             # 重置滚动位置
             self.message_frame.canvas.yview_moveto(0)
         except Exception:
@@ -1408,7 +1345,7 @@ class AMapGUI:
     def clear_placeholder(self, event):
         """当输入框获得焦点时，清除占位提示文字并恢复正常颜色。"""
         widget = event.widget
-        if widget == self.keyword_entry and self.keyword_entry.get() == "查询完成后，先点击恢复状态，再进行新查询":
+        if widget == self.keyword_entry and self.keyword_entry.get() == self.KEYWORD_PLACEHOLDER:
             self.keyword_entry.delete(0, tk.END)
             self.keyword_entry.config(foreground='black')
         elif widget == self.api_key_entry and self.api_key_entry.get() == "可输入多个key，每个key用空格隔开":
@@ -1497,9 +1434,12 @@ class AMapGUI:
     def add_placeholder(self, event):
         """当输入框失去焦点且为空时，恢复占位提示文字与灰色。"""
         widget = event.widget
+        if widget == self.keyword_entry and not self.is_searching:
+            # 进度按关键词统计，切换关键词后刷新
+            self.update_progress(len(self._all_region_names()))
         if widget == self.keyword_entry and self.keyword_entry.get() == "":
             self.keyword_entry.config(foreground='grey')
-            self.keyword_entry.insert(0, "查询完成后，先点击恢复状态，再进行新查询")
+            self.keyword_entry.insert(0, self.KEYWORD_PLACEHOLDER)
         elif widget == self.api_key_entry and self.api_key_entry.get() == "":
             self.api_key_entry.config(foreground='grey')
             self.api_key_entry.insert(0, "可输入多个key，每个key用空格隔开")   
@@ -1514,7 +1454,7 @@ class AMapGUI:
             collect_times = self.auto_collect_times_entry.get().split()
             if current_time in collect_times:
                 if not hasattr(self, 'last_collect_time') or self.last_collect_time != current_time:
-                    self.start_search()
+                    self.start_search(scheduled=True)
                     self.last_collect_time = current_time
 
             next_time = self.get_next_collect_time(now, collect_times)
@@ -1546,6 +1486,7 @@ class AMapGUI:
         folder_path = os.path.dirname(os.path.abspath(self.realtime_export_path_entry.get().strip()))
 
         folder_path = folder_path if folder_path else '.'
+        import webbrowser
         webbrowser.open(folder_path)
 
 
@@ -1606,37 +1547,38 @@ class AMapGUI:
         self.on_city_checks_changed()
 
 
-    def start_search(self):
-        """校验输入，确定目标地区，并启动检索线程。"""
+    def start_search(self, scheduled=False):
+        """校验输入，确定目标地区，并启动检索线程。
+
+        scheduled=True 为定时采集触发：不弹出询问，总是重新采集全部所选区域。
+        """
         # 若已有查询在进行，直接忽略以避免重复日志/并发线程
         if getattr(self, 'is_searching', False):
             show_centered_message("提示", "已有查询在进行中，请先停止或等待完成", "info", self.root)
             return
-        # 获取 API Keys 列表（空格分隔，多 key 轮换）
+        # 获取 API Keys 列表（空格分隔，多 key 同时使用）
         self.api_keys = [key for key in self.api_key_entry.get().strip().split() if key != '可输入多个key，每个key用空格隔开' and key]
-        self.current_key_index = 0  # 当前使用的 key 下标
 
-        keyword = self.keyword_entry.get().strip()  # 检索关键词
+        keyword_text = self.keyword_entry.get().strip()  # 检索关键词（可用逗号/顿号分隔多个）
+        keywords = split_keywords(keyword_text) if keyword_text != self.KEYWORD_PLACEHOLDER else []
 
-        if not self.api_keys or not self.api_keys[0] or not keyword or keyword == "查询完成后，先点击恢复状态，再进行新查询":
+        if not self.api_keys or not self.api_keys[0] or not keywords:
             show_centered_message("警告", "API Key 和 关键词 都不能为空", "warning", self.root)
             return
 
-        # 初始化第一个 API Key（不输出日志，避免重复）
-        if self.api_keys:
-            self.api_key = self.api_keys[0]
-            self.current_key_index = 1
-            print(f"当前正在使用第 1 个 key: {self.api_key}")
+        # 初始化 key 池：每个 key 独立限速与计额，请求分配给有余量的 key
+        settings = self.config_manager.get_user_settings()
+        self.key_pool = ApiKeyPool(
+            self.api_keys,
+            qps_per_key=settings.get('key_qps', 3.0),
+            daily_quota=settings.get('key_daily_quota', 0),
+        )
+        print(f"当前共有 {len(self.key_pool)} 个 key 参与查询")
 
         # 仅使用 UI 中的省市选择，不再从文件导入
         if self.select_all_var.get():
             # 全选：从配置聚合所有城市名称
-            regions = []
-            provinces = self.config_manager.get_provinces()
-            for p in provinces.values():
-                for city_name, city_data in p.get('cities', {}).items():
-                    if city_name:
-                        regions.append(city_name)
+            regions = self._all_region_names()
         else:
             regions = list(self.selected_cities)
             print(f"调试：选中的城市列表：{regions}")
@@ -1644,39 +1586,32 @@ class AMapGUI:
                 show_centered_message("警告", "请先在右侧城市列表中选择至少一个城市", "warning", self.root)
                 return
 
-        # 检查是否选择了过多城市，建议分批处理
-        if len(regions) > 50 and not getattr(self, 'batch_mode', False):
-            # 对于askyesnocancel，我们需要特殊处理
-            root = tk.Tk()
-            root.withdraw()
-            result = messagebox.askyesnocancel(
-                "批量查询警告", 
-                f"您选择了 {len(regions)} 个城市，建议分批处理以避免程序崩溃。\n\n" +
-                "• 点击'是'：启用批量处理模式（推荐）\n" +
-                "• 点击'否'：一次性查询所有城市（可能崩溃）\n" +
-                "• 点击'取消'：取消本次查询",
-                parent=root
+        # 关键词 × 区域展开为任务矩阵，共用同一个 key 池与限速
+        jobs = [(keyword, region) for keyword in keywords for region in regions]
+        keyword_label = "、".join(keywords)
+
+        # 进度按关键词记录：已查询过的 (关键词, 区域) 可直接跳过，避免重复消耗配额
+        done_jobs = [(keyword, region) for keyword, region in jobs
+                     if self.config_manager.is_queried(self.config_manager.get_city_code(region), keyword)]
+        if done_jobs and not scheduled:
+            skip = messagebox.askyesno(
+                "跳过已查询区域",
+                f"关键词“{keyword_label}”在所选区域中共 {len(jobs)} 个任务，已查询过 {len(done_jobs)} 个。\n\n"
+                "• 点击'是'：跳过这些区域，只查询其余区域\n"
+                "• 点击'否'：全部重新查询",
+                parent=self.root
             )
-            # 居中显示
-            root.update_idletasks()
-            x = (root.winfo_screenwidth() // 2) - (root.winfo_width() // 2)
-            y = (root.winfo_screenheight() // 2) - (root.winfo_height() // 2)
-            root.geometry(f"+{x}+{y}")
-            root.destroy()
-            
-            if result is None:  # 取消
-                return
-            elif result:  # 是 - 启用批量处理
-                self.batch_mode = True
-                self.batch_size = min(10, max(5, len(regions) // 10))  # 动态计算批次大小
-                show_centered_message("批量处理", f"将以每批 {self.batch_size} 个城市的方式处理，预计需要 {len(regions) // self.batch_size + 1} 个批次。", "info", self.root)
-            else:  # 否 - 一次性查询
-                self.batch_mode = False
-        else:
-            self.batch_mode = False
+            if skip:
+                done_set = set(done_jobs)
+                jobs = [job for job in jobs if job not in done_set]
+                if not jobs:
+                    show_centered_message("提示", f"所选区域在关键词“{keyword_label}”下均已查询完成", "info", self.root)
+                    return
 
-        # 记录本次运行的目标与完成进度
-        self.current_run_cities = set(regions)
+        # 记录本次运行的目标与完成进度（以 (关键词, 区域) 为单位）
+        self.current_run_cities = set(jobs)
+        # 多关键词时结果与导出增加“关键词”列，便于区分命中来源
+        self.keyword_column = len(keywords) > 1
         self.completed_run_cities = set()
 
         # 初始化进度显示（本次运行总数）
@@ -1692,289 +1627,140 @@ class AMapGUI:
         except Exception:
             pass
 
+        # 结果逐页写入 SQLite 结果库，导出时按本轮 run_id 流式读取；
+        # 去重范围：run=本轮内跨城市去重，history=与全部历史结果去重，off=不去重
+        self.dedup_scope = settings.get('dedup_scope', 'run')
+        if self.dedup_scope not in ('run', 'history', 'off'):
+            self.dedup_scope = 'run'
+        try:
+            # 本次任务中有上次中断留下的页断点时沿用原轮次，续跑结果与中断前的结果同属一轮
+            job_roots = [(keyword, self.config_manager.get_city_code(region)) for keyword, region in jobs]
+            self.current_run_id = self.open_poi_store().resumable_run(job_roots)
+            if self.current_run_id is None:
+                self.current_run_id = self.poi_store.begin_run(",".join(keywords))
+            self.run_duplicates_base = self.poi_store.duplicates
+        except sqlite3.Error as e:
+            show_centered_message("错误", f"打开结果库失败：{e}", "error", self.root)
+            return
+
         self.is_searching = True  # 置为检索中
         self.is_paused = False
         # 启用暂停按钮
         if hasattr(self, 'pause_button'):
             self.pause_button.configure(state='normal', text='暂停')
         
-        if self.batch_mode:
-            # 批量处理模式
-            threading.Thread(target=self.search_pois_batch, args=(keyword, regions), daemon=True).start()
-        else:
-            # 传统模式
-            threading.Thread(target=self.search_pois, args=(keyword, regions), daemon=True).start()  # 后台线程执行，避免卡住 UI
+        # 全部任务交给同一次引擎运行：并发度与限速由引擎和 key 池统一控制，无需分批
+        threading.Thread(target=self.search_pois, args=(jobs,), daemon=True).start()  # 后台线程执行，避免卡住 UI
 
         
     
-    def use_next_api_key(self):
-        """切换到下一个 API Key；全部用尽则停止。"""
-        if self.current_key_index < len(self.api_keys):
-            self.api_key = self.api_keys[self.current_key_index]
-            self.current_key_index += 1
-            print(f"切换到第 {self.current_key_index} 个 key: {self.api_key}")
-        else:
-            print("所有 key 都用完，程序结束。")
-            self.insert_text(self.frame1, "所有 key 都用完，程序结束。\n")
-            self.is_searching = False
-
-
     def insert_text(self, frame, text):
-        """向指定面板追加一条文本记录（左对齐，自动换行）。确保在主线程更新UI。"""
-        if not hasattr(self, 'frames'):
-            self.frames = []
-
+        """向指定面板追加一条文本记录（左对齐，自动换行）。由主线程在下一个节拍批量显示。"""
         # 去除尾部换行，避免额外间距；空行直接忽略
         text = (text or '').rstrip('\n')
         if text.strip() == '':
             return
+        # 非检索期间的日志不显示（与原先主线程回调中的判断一致，改为投递时判断）
+        if not self.is_searching:
+            return
+        self.ui_updates.post_log(frame, text)
 
-        # 在主线程执行实际的UI更新，避免后台线程直接操作Tk
-        def _do_update():
-            # 检查窗口是否还存在
-            try:
-                if not self.is_searching or not hasattr(self, 'root') or not self.root.winfo_exists():
-                    return
-            except Exception:
-                return
-
-            # 与日志区域统一的淡灰背景（放在主线程读取）
-            try:
-                bg_local = self.message_frame.scrollable_frame.cget('bg')
-            except Exception:
-                bg_local = None
-            if not bg_local:
-                bg_local = '#f3f4f6'
-
-            try:
-                label = tk.Label(frame, text=text, anchor='w', bg=bg_local)
-                label.pack(fill='x', padx=0, pady=0, ipady=0)
-            except Exception:
-                return
-
-            # 自动滚动到最底部（日志与POI区域）
-            try:
-                self.root.update_idletasks()
-            except Exception:
-                pass
-            try:
-                if hasattr(self, 'message_frame') and hasattr(self.message_frame, 'canvas'):
+    def _drain_ui_updates(self):
+        """主线程节拍：一次性应用所有待处理的界面更新，然后预约下一个节拍。"""
+        try:
+            events, logs, progress = self.ui_updates.take()
+            for kind, payload in events:
+                try:
+                    if kind == 'rows':
+                        self.results_table.append_rows(payload)
+                    else:
+                        payload()
+                except Exception as e:
+                    print(f"界面更新失败: {e}")
+
+            if logs:
+                # 与日志区域统一的淡灰背景
+                try:
+                    bg_local = self.message_frame.scrollable_frame.cget('bg')
+                except Exception:
+                    bg_local = None
+                if not bg_local:
+                    bg_local = '#f3f4f6'
+                # 单个节拍内超出上限的部分不必显示，直接转存
+                for frame, text in logs[:-self.log_max_lines]:
+                    self._archive_log_line(text)
+                for frame, text in logs[-self.log_max_lines:]:
+                    try:
+                        self._append_log_label(frame, text, bg_local)
+                    except Exception:
+                        continue
+                # 整批追加后只滚动一次到最底部
+                try:
+                    self.root.update_idletasks()
                     self.message_frame.canvas.yview_moveto(1)
-            except Exception:
-                pass
+                except Exception:
+                    pass
+
+            if progress is not None:
+                progress()
+        finally:
             try:
-                if hasattr(self, 'table_frame') and hasattr(self.table_frame, 'canvas'):
-                    self.table_frame.canvas.yview_moveto(1)
+                if self.root.winfo_exists():
+                    self.root.after(self.UI_TICK_MS, self._drain_ui_updates)
             except Exception:
                 pass
 
-        try:
-            # 将UI更新安排到主线程
-            self.root.after(0, _do_update)
-        except Exception:
-            # 如果无法调度，直接忽略该条
-            pass
-
-    def search_pois(self, keyword, regions):
-        """分页请求高德文本检索接口，持续更新界面并按需导出。"""
-        self.clear_frames()
-
-        selected_fields = [(chinese, english) for chinese, (english, var) in self.fields.items() if var.get()]
+    def _append_log_label(self, frame, text, bg):
+        """追加一行日志；达到上限时复用最旧的一行（环形缓冲），被挤出的内容写入日志文件。"""
+        labels = self._log_labels.setdefault(frame, deque())
+        if len(labels) >= self.log_max_lines:
+            label = labels.popleft()
+            self._archive_log_line(label.cget('text'))
+            label.pack_forget()
+            label.config(text=text)
+        else:
+            label = tk.Label(frame, text=text, anchor='w', bg=bg)
+        label.pack(fill='x', padx=0, pady=0, ipady=0)
+        labels.append(label)
 
-        self.frames = []
-        for idx in range(len(selected_fields)):
-            frame = self.create_frame(self.table_frame.get_frame())
-            self.frames.append(frame)
+    def _archive_log_line(self, text):
+        """将移出日志面板的行写入滚动日志文件（单个文件 1MB，保留 5 个备份）。"""
+        try:
+            if self._log_archive is None:
+                path = self.config_manager.get_user_settings().get('log_file') or 'query_log.txt'
+                handler = RotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=5, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger = logging.getLogger('mapsearch.query_log')
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                for old in list(logger.handlers):
+                    logger.removeHandler(old)
+                    old.close()
+                logger.addHandler(handler)
+                self._log_archive = logger
+            self._log_archive.info(text)
+        except Exception as e:
+            print(f"写入日志文件失败: {e}")
 
-        url = "https://restapi.amap.com/v3/place/text"  # 文本检索接口
-        session = requests.Session()
-        # 基础重试策略：429/5xx 时退避重试
-        retry = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("https://", adapter)
-
-        all_pois = []
-        total_regions = len(regions)
-
-        while regions and self.is_searching:
-            # 暂停控制：若暂停，保持空转等待恢复
-            while self.is_paused and self.is_searching:
-                time.sleep(0.2)
-            region = regions.pop(0)
-            # 从配置中查找城市代码（用于查询和状态更新）
-            region_code_list = []
-            provinces = self.config_manager.get_provinces()
-            for province_name, province_data in provinces.items():
-                cities = province_data.get('cities', {})
-                for city_name, city_data in cities.items():
-                    if city_name == region:
-                        region_code_list = [city_data.get('adcode')]
-                        break
-                if region_code_list:
-                    break
-            print(f"正在查询 {region}...代码：{region_code_list}")
-            if not region_code_list:
-                self.insert_text(self.frame1, f"找不到城市代码：{region}\n")
-                continue
+    def search_pois(self, jobs):
+        """通过并发检索引擎分页请求高德文本检索接口（jobs 为 [(关键词, 区域), ...]），持续更新界面并按需导出。"""
+        selected_fields = self._selected_fields()
 
-            region_code = region_code_list[0]
-            page_num = 1
-            pois = []
-
-            # 合并"开始查询"和首次状态为一行输出
-            start_time = datetime.now().strftime('%Y/%m/%d %H:%M:%S')
-            status_logged = False  # 仅记录一次状态行
-            status_printed = False  # 控制台仅打印一次状态码
-            while self.is_searching:
-                # 暂停控制
-                while self.is_paused and self.is_searching:
-                    time.sleep(0.2)
-                # 构建请求参数（每页 20 条）
-                params = {
-                    "key": self.api_key,
-                    "keywords": keyword,
-                    "city": region_code,  # 使用 adcode 值进行查询
-                    "offset": 20,
-                    "output": "json",
-                    "page": page_num,
-                }
-                response = session.get(url, params=params)
-                data = response.json()
-
-                status_code = response.status_code
-                status_value = data.get('status')
-                status_info = data.get('info')
-                if not status_printed:
-                    print(f"状态码: {status_code}, 返回状态值: {status_value}, 返回状态说明: {status_info}")
-                    status_printed = True
-                if not status_logged:
-                    self.insert_text(self.frame1, f"{start_time} | {region} — 状态码: {status_code}, 状态: {status_info}\n")
-                    status_logged = True
-
-                if status_code == 200 and status_value == '0':
-                    # 高德返回状态为 0：通常为限额或 key 问题
-                    if status_info == 'USER_DAILY_QUERY_OVER_LIMIT':
-                        print("查询已超出每日限制，切换到下一个 key。")
-                        self.insert_text(self.frame1, "查询已超出每日限制，切换到下一个 key。\n")
-                    elif status_info == 'INVALID_USER_KEY':
-                        print("无效的用户密钥，切换到下一个 key。")
-                        self.insert_text(self.frame1, "无效的用户密钥，切换到下一个 key。\n")
-                    self.use_next_api_key()
-                    if not self.is_searching:
-                        return
-                    continue
-
-                if data["status"] == "1" and int(data["count"]) > 0:
-                    # 有结果：累加、显示，并按需实时写入 CSV
-                    new_pois = data["pois"]
-                    pois.extend(new_pois)
-                    for poi in new_pois:
-                        display_texts = [f"{chinese}: {poi[english]}" for chinese, english in selected_fields if english in poi]
-                        for idx, text in enumerate(display_texts):
-                            self.insert_text(self.frames[idx], text)
-
-                        self.table_frame.canvas.yview_moveto(1)
-
-                    if self.realtime_export_var.get():
-                        self.export_to_csv_realtime(new_pois)
-
-                    # 小于一页，说明已到末页
-                    if len(new_pois) < 20:
-                        break
-                    page_num += 1
-                    time.sleep(1.1)  # 轻微限速，避免过快触发风控
-                else:
-                    # 无更多数据或状态异常，结束本城市循环
-                    break
+        self.reset_results_table(selected_fields)
+        self.open_realtime_sink(selected_fields)
+        self.open_response_cache()
 
-            all_pois.extend(pois)
-            
-            # 更新城市查询状态到配置文件
-            # 从配置中查找城市代码和省份名
-            city_code = '000000'
-            province_name = ''
-            provinces = self.config_manager.get_provinces()
-            for p_name, p_data in provinces.items():
-                cities = p_data.get('cities', {})
-                for city_name, city_data in cities.items():
-                    if city_name == region:
-                        city_code = city_data.get('adcode', '000000')
-                        province_name = p_name
-                        break
-                if province_name:
-                    break
-            
-            self.config_manager.update_city_query_status(
-                province_name, city_code, region, True
-            )
-            
-            # 本次运行进度更新
-            self.mark_city_completed(region)
-            self.update_progress_run()
+        engine = self._run_engine(jobs, selected_fields)
 
+        self.log_dedup_summary()
+        self.log_saturation_summary(engine.saturated)
+        self.log_failed_tasks(engine.failed_tasks)
+        self.close_response_cache()
         self.insert_text(self.frame1, "查询结束.\n\n")
-        self.insert_text(self.frames[0], "\n")
-        self.insert_text(self.frames[1], "\n")
-        self.table_frame.canvas.yview_moveto(1)
-        self.pois_data = all_pois
-        # 结束时将进度置为100%
-        self.finalize_progress_run()
-        # 标记完成，允许再次发起查询
-        self.is_searching = False
-        self.is_paused = False
-        if hasattr(self, 'pause_button'):
-            try:
-                self.pause_button.configure(state='disabled', text='暂停')
-            except Exception:
-                pass
-        
-    def search_pois_batch(self, keyword, regions):
-        """批量处理城市查询，防止程序崩溃。"""
-        self.clear_frames()
-        
-        selected_fields = [(chinese, english) for chinese, (english, var) in self.fields.items() if var.get()]
-        
-        self.frames = []
-        for idx in range(len(selected_fields)):
-            frame = self.create_frame(self.table_frame.get_frame())
-            self.frames.append(frame)
-        
-        total_regions = len(regions)
-        batch_size = getattr(self, 'batch_size', 5)  # 默认每批 5 个城市
-        all_pois = []
-        batch_count = 0
-        
-        self.insert_text(self.frame1, f"开始批量处理 {total_regions} 个城市，每批 {batch_size} 个...\n")
-        
-        while regions and self.is_searching:
-            # 取一批城市
-            current_batch = regions[:batch_size]
-            regions = regions[batch_size:]
-            batch_count += 1
-            
-            self.insert_text(self.frame1, f"\n─── 正在处理第 {batch_count} 批（{len(current_batch)} 个城市） ───\n")
-            
-            # 处理当前批次
-            batch_pois = self._process_batch(keyword, current_batch, selected_fields)
-            all_pois.extend(batch_pois)
-            
-            # 更新进度
-            processed_count = (batch_count * batch_size) - len(regions)
-            progress_percent = (processed_count / total_regions) * 100
-            self.insert_text(self.frame1, f"已处理 {processed_count}/{total_regions} 个城市 ({progress_percent:.1f}%)\n")
-            
-            # 批次间隔，防止API限流
-            if regions and self.is_searching:  # 还有更多批次
-                self.insert_text(self.frame1, "批次处理间隔 5 秒，防止API限流...\n")
-                time.sleep(5)  # 批次间隔
-        
-        if self.is_searching:
-            self.insert_text(self.frame1, f"\n✅ 批量处理完成！共处理 {batch_count} 个批次，获取 {len(all_pois)} 条POI数据\n")
-        else:
-            self.insert_text(self.frame1, "\n⚠️ 批量处理已停止\n")
-            
-        self.table_frame.canvas.yview_moveto(1)
-        self.pois_data = all_pois
+        # 先提交结果库（同时把最后一批交给实时导出），再关闭写入线程
+        self.poi_store.flush()
+        self.close_realtime_sink()
+        self.config_manager.flush()
         # 结束时将进度置为100%
         self.finalize_progress_run()
         # 标记完成，允许再次发起查询
@@ -1986,166 +1772,194 @@ class AMapGUI:
             except Exception:
                 pass
         
-    def _process_batch(self, keyword, city_batch, selected_fields):
-        """处理一个批次的城市查询。"""
-        batch_pois = []
-        url = "https://restapi.amap.com/v3/place/text"
-        session = requests.Session()
-        
-        # 设置超时和重试
-        retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("https://", adapter)
-        
-        for region in city_batch:
-            # 暂停控制
-            while self.is_paused and self.is_searching:
-                time.sleep(0.2)
-            if not self.is_searching:
-                break
-                
-            try:
-                # 从配置中查找城市代码
-                region_code_list = []
-                provinces = self.config_manager.get_provinces()
-                for province_name, province_data in provinces.items():
-                    cities = province_data.get('cities', {})
-                    for city_name, city_data in cities.items():
-                        if city_name == region:
-                            region_code_list = [city_data.get('adcode')]
-                            break
-                    if region_code_list:
-                        break
-                
-                if not region_code_list:
-                    self.insert_text(self.frame1, f"⚠️ 找不到城市代码：{region}\n")
-                    continue
-                
-                region_code = region_code_list[0]
-                self.insert_text(self.frame1, f"🔍 查询 {region} ({region_code})...")
-                
-                # 单个城市查询
-                city_pois = self._query_single_city(session, url, keyword, region, region_code, selected_fields)
-                batch_pois.extend(city_pois)
-                
-                # 更新查询状态
-                self._update_city_query_status(region, region_code)
-                self.mark_city_completed(region)
-                self.update_progress_run()
-                
-                self.insert_text(self.frame1, f" ✅ 完成，获取 {len(city_pois)} 条数据\n")
-                
-                # 城市间隔，防止过快请求
-                time.sleep(0.5)
-                
-            except Exception as e:
-                self.insert_text(self.frame1, f" ❌ 失败：{str(e)}\n")
+    def _run_engine(self, jobs, selected_fields):
+        """用并发检索引擎抓取 jobs（[(关键词, 区域), ...]），结果交给 dispatch_pois，返回运行完的引擎。"""
+        # 从配置索引中查找城市代码（用于查询和状态更新）
+        targets = []
+        for keyword, region in jobs:
+            region_code = self.config_manager.get_city_code(region)
+            if not region_code:
+                self.insert_text(self.frame1, f"找不到城市代码：{region}\n")
                 continue
-        
-        return batch_pois
-        
-    def _query_single_city(self, session, url, keyword, region, region_code, selected_fields):
-        """查询单个城市的POI数据（含多页翻页与实时导出）。"""
-        city_pois = []
-        page_num = 1
-        max_pages = 10  # 限制每个城市最多查询页数，防止无限循环
-        
-        while page_num <= max_pages and self.is_searching:
-            # 暂停控制
-            while self.is_paused and self.is_searching:
-                time.sleep(0.2)
-            try:
-                params = {
-                    "key": self.api_key,
-                    "keywords": keyword,
-                    "city": region_code,  # 使用 adcode 值进行查询
-                    "offset": 20,
-                    "output": "json",
-                    "page": page_num,
-                }
-                
-                response = session.get(url, params=params, timeout=10)
-                data = response.json()
-                
-                if response.status_code != 200:
-                    break
-                    
-                if data.get("status") == "0":
-                    # API错误，尝试切换key
-                    self.use_next_api_key()
-                    if not self.is_searching:
-                        break
-                    continue
-                
-                if data.get("status") == "1" and int(data.get("count", 0)) > 0:
-                    new_pois = data.get("pois", [])
-                    city_pois.extend(new_pois)
-                    
-                    # 显示POI数据
-                    for poi in new_pois:
-                        display_texts = [f"{chinese}: {poi.get(english, '无数据')}" for chinese, english in selected_fields if english in poi]
-                        for idx, text in enumerate(display_texts):
-                            if idx < len(self.frames):
-                                self.insert_text(self.frames[idx], text)
-                    
-                    # 实时导出
-                    if self.realtime_export_var.get():
-                        self.export_to_csv_realtime(new_pois)
-                    
-                    # 小于一页，说明已到末页
-                    if len(new_pois) < 20:
-                        break
-                    page_num += 1
-                    
-                else:
-                    # 无数据或其他情况
-                    break
-                    
-            except requests.RequestException as e:
-                # 网络错误，跳过该页
-                break
-            except Exception as e:
-                # 其他错误，跳过该页
-                break
-        
-        return city_pois
-        
-    def _update_city_query_status(self, region, region_code):
-        """更新城市查询状态到配置，供后续进度统计使用。"""
+            targets.append((keyword, region, region_code))
+
+        def _on_pois(keyword, region, region_code, new_pois, cursor, done):
+            # 有结果：写入结果库（连同页断点）、显示，并按需实时写入 CSV；本页落盘后通知引擎
+            self.dispatch_pois(keyword, region_code, new_pois, selected_fields, cursor=cursor, on_durable=done)
+
+        def _on_city_done(keyword, region, region_code, count):
+            # 更新城市查询状态到配置文件，清除其页断点，并刷新本次运行进度
+            self._update_city_query_status(region, region_code, keyword)
+            self.poi_store.clear_checkpoints(keyword, region_code)
+            self.mark_city_completed((keyword, region))
+            self.update_progress_run()
+
+        job_roots = [(keyword, region_code) for keyword, _, region_code in targets]
+        task_queue = self.open_task_queue()
+        # 属于其他轮次或已过期的断点不能沿用到本轮：连同任务队列记录一起清除，这些区域从第 1 页重新抓取
+        for keyword, root in self.poi_store.discard_stale_checkpoints(job_roots, self.current_run_id):
+            task_queue.clear(keyword, root)
+        done_pages = self.poi_store.load_checkpoints(job_roots)
+        if done_pages:
+            resumed = "、".join(dict.fromkeys(keyword for keyword, _, _ in done_pages))
+            self.insert_text(self.frame1, f"检测到“{resumed}”上次未完成的检索，将从断点继续\n")
+
+        settings = self.config_manager.get_user_settings()
+        engine_options = dict(
+            workers=settings.get('crawl_workers', 4),
+            on_log=lambda text: self.insert_text(self.frame1, text),
+            on_pois=_on_pois,
+            on_city_done=_on_city_done,
+            is_running=lambda: self.is_searching,
+            is_paused=lambda: self.is_paused,
+            cache=self.response_cache,
+            done_pages=done_pages,
+            task_queue=task_queue,
+        )
         try:
-            # 从配置中查找省份名
-            province_name = ''
-            provinces = self.config_manager.get_provinces()
-            for p_name, p_data in provinces.items():
-                cities = p_data.get('cities', {})
-                for city_name, city_data in cities.items():
-                    if city_name == region:
-                        province_name = p_name
-                        break
-                if province_name:
-                    break
+            # crawl_engine=asyncio 时使用单事件循环的异步引擎（需要 aiohttp）
+            engine = create_crawl_engine(settings.get('crawl_engine', 'thread'), self.key_pool,
+                                         concurrency=settings.get('async_concurrency', 64), **engine_options)
+        except RuntimeError as e:
+            self.insert_text(self.frame1, f"{e}，改用线程引擎\n")
+            engine = CrawlEngine(self.key_pool, **engine_options)
+        engine.run(targets)
+        # 提交最后一批结果：其中各页随之确认落盘，任务队列才将它们标记为已完成
+        self.poi_store.flush()
+        if engine.resumed_pages:
+            self.insert_text(self.frame1, f"从断点续跑：跳过上次已完成的 {engine.resumed_pages} 页\n")
+
+        return engine
+
+    def log_saturation_summary(self, saturated):
+        """在日志中列出无法再细分、结果仍达到接口上限（可能不完整）的区域。"""
+        if not saturated:
+            return
+        names = "、".join(f"{name}({code})「{keyword}」" for keyword, name, code in saturated)
+        self.insert_text(self.frame1, f"⚠️ 以下区域结果达到接口上限 {CrawlEngine.RESULT_CEILING} 条，可能不完整：{names}\n")
+
+    def log_failed_tasks(self, failed_tasks):
+        """在日志中列出多次重试仍失败的页；它们保留在任务队列中，下次检索这些区域时重新排队。"""
+        if not failed_tasks:
+            return
+        pages = "、".join(f"{name}({code})「{keyword}」第{page}页" for keyword, name, code, page, _, _ in failed_tasks)
+        self.insert_text(self.frame1, f"⚠️ 以下页多次重试仍失败，已保留在任务队列中，下次检索时继续：{pages}\n")
+
+    def _update_city_query_status(self, region, region_code, keyword=None):
+        """更新城市查询状态（含该关键词下的进度）到配置，供后续进度统计使用。"""
+        try:
+            # 从配置索引中查找省份名
+            province_name = self.config_manager.find_province_by_city_code(region_code)
+            if not province_name:
+                province_name, _ = self.config_manager.find_city(region)
             
-            self.config_manager.update_city_query_status(province_name, region_code, region, True)
+            self.config_manager.update_city_query_status(province_name, region_code, region, True, keyword=keyword)
             
             # 不再维护 queried_cities 内存副本，统一以配置为准
             
         except Exception as e:
             print(f"更新查询状态失败: {e}")
         
-    def clear_frames(self):
-        """销毁结果面板中的所有 frame，便于新一轮查询重建。"""
-        if hasattr(self, 'frames'):
-            for frame in self.frames:
-                frame.destroy()
-            self.frames = []
+    def open_poi_store(self):
+        """打开（首次使用时创建）SQLite 结果库。"""
+        if getattr(self, 'poi_store', None) is None:
+            path = self.config_manager.get_user_settings().get('result_db') or 'results.db'
+            self.poi_store = PoiStore(path)
+        return self.poi_store
+
+    def open_task_queue(self):
+        """打开（首次使用时创建）持久化页任务队列。"""
+        if getattr(self, 'task_queue', None) is None:
+            settings = self.config_manager.get_user_settings()
+            self.task_queue = TaskQueue(settings.get('task_queue_db') or 'task_queue.db',
+                                        max_attempts=settings.get('task_max_attempts', 5))
+        return self.task_queue
+
+    def open_response_cache(self):
+        """按设置打开本轮使用的接口响应缓存；TTL 为 0 时不启用。"""
+        settings = self.config_manager.get_user_settings()
+        ttl_hours = float(settings.get('response_cache_ttl_hours', 24) or 0)
+        self.response_cache = None
+        if ttl_hours <= 0:
+            return None
+        try:
+            self.response_cache = ResponseCache(
+                settings.get('response_cache_db') or 'response_cache.db',
+                ttl_seconds=ttl_hours * 3600,
+                max_entries=settings.get('response_cache_max_entries', 50000),
+            )
+        except sqlite3.Error as e:
+            self.insert_text(self.frame1, f"响应缓存不可用，将直接请求接口：{e}\n")
+        return self.response_cache
+
+    def close_response_cache(self):
+        """在日志中汇报本轮缓存命中情况并关闭缓存。"""
+        cache = getattr(self, 'response_cache', None)
+        if cache is None:
+            return
+        self.insert_text(self.frame1, cache.summary() + "\n")
+        cache.close()
+        self.response_cache = None
+
+    def dispatch_pois(self, keyword, region_code, pois, selected_fields, cursor=None, on_durable=None):
+        """将一页新到的 POI 按 id 去重后交给所有下游：结果库、结果表与实时导出。
+
+        cursor 为页断点，与本页 POI 同批提交到结果库；实时导出在该批提交后才写入，续跑时不会重复写入 CSV。
+        on_durable 在该批提交后调用，通知引擎本页已落盘。
+        窗口关闭后到达的页直接丢弃（不写入断点），下次续跑时重新抓取。
+        """
+        keyword_column = getattr(self, 'keyword_column', False)
+
+        def _export(fresh):
+            # 多关键词检索：实时导出时附上命中该 POI 的关键词（未勾选实时导出时不会创建写入线程）
+            if fresh:
+                self.export_to_csv_realtime([dict(poi, keyword=keyword) for poi in fresh] if keyword_column else fresh)
+            if on_durable is not None:
+                on_durable()
+
+        with self._dispatch_lock:
+            if self._closing:
+                return
+            pois = self.poi_store.add(self.current_run_id, keyword, region_code, pois,
+                                      dedup=self.dedup_scope, cursor=cursor, on_commit=_export)
+            if not pois:
+                return
+            if keyword_column:
+                pois = [dict(poi, keyword=keyword) for poi in pois]
+            self.show_pois(pois, selected_fields)
+
+    def log_dedup_summary(self):
+        """在日志中汇报本轮因重复而跳过的 POI 数量。"""
+        skipped = self.poi_store.duplicates - getattr(self, 'run_duplicates_base', 0)
+        if skipped:
+            scope = "历史结果" if self.dedup_scope == 'history' else "本轮结果"
+            self.insert_text(self.frame1, f"按 POI id（同一关键词内）去重：跳过与{scope}重复的 {skipped} 条\n")
+
+    def reset_results_table(self, selected_fields):
+        """按本轮所选字段重建结果表的列并清空数据（在主线程执行）。"""
+        columns = [chinese for chinese, _ in selected_fields]
+        self.ui_updates.post_call(lambda: self.results_table.set_columns(columns))
+
+    def show_pois(self, pois, selected_fields):
+        """将一页 POI 转为表格行并追加到结果表（在主线程执行）。"""
+        rows = []
+        for poi in pois:
+            row = []
+            for _, english in selected_fields:
+                value = poi.get(english, '')
+                if value == "[]" or (isinstance(value, list) and len(value) == 0):
+                    value = ''
+                row.append(value)
+            rows.append(tuple(row))
+        self.ui_updates.post_rows(rows)
 
 
     def fetch_province_city_data(self):
-        """通过高德行政区划接口加载省/市列表，并填充多选框。
+        """通过高德行政区划接口加载省/市/区县列表，并填充多选框。
         
         使用说明：
-        - 需已填写有效 Web 服务 Key（GENERAL.api_keys 的第一个）。
-        - 先拉取省级，再按省遍历拉取市级，构建 self.province_to_cities 与 self.city_name_to_adcode。
+        - 需已填写有效 Web 服务 Key（多个 Key 经 key 池共同限速）。
+        - 一次 subdistrict=3 请求取回全国行政区划树，失败时退回按省并发拉取，见 _load_region_tree。
         """
         # 防抖：若正在加载，则提示并返回
         if getattr(self, 'is_loading_province_city', False):
@@ -2156,7 +1970,7 @@ class AMapGUI:
         if not api_keys_text:
             show_centered_message("警告", "请先填写 API Key 再加载省/市。", "warning", self.root)
             return
-        api_key = api_keys_text.split()[0]
+        api_keys = [key for key in api_keys_text.split() if key != '可输入多个key，每个key用空格隔开' and key]
 
         # 清空 UI（在主线程执行）
         self.province_to_cities = {}
@@ -2181,104 +1995,23 @@ class AMapGUI:
 
         def _load():
             try:
-                # 1) 拉取省级
-                url = "https://restapi.amap.com/v3/config/district"
-                
-                # 支持多个API Key
-                api_keys = [key.strip() for key in api_key.split() if key.strip()]
-                current_key_index = 0
-                
-                def get_next_api_key():
-                    nonlocal current_key_index
-                    key = api_keys[current_key_index]
-                    current_key_index = (current_key_index + 1) % len(api_keys)
-                    return key
-                
-                params = {
-                    "key": get_next_api_key(),
-                    "keywords": "中国",
-                    "subdistrict": 1,
-                    "extensions": "base",
-                }
-                resp = requests.get(url, params=params)
-                data = resp.json()
-                if data.get("status") != "1":
-                    raise RuntimeError(f"加载省份失败: {data.get('info')}")
-                provinces = data.get("districts", [])[0].get("districts", [])
-                # 在后台线程中构建数据，稍后切回主线程更新 UI
-                province_to_cities: dict[str, list[tuple[str, str]]] = {}
-                city_name_to_adcode: dict[str, str] = {}
-                
-                total_provinces = len(provinces)
-                current_province = 0
-                
-                for p in provinces:
-                    pname = p.get("name")
-                    pcode = p.get("adcode")
-                    print(f"正在加载 {pname} ({pcode}) 的城市数据...")
-                    
-                    # 添加延迟避免API限制
-                    import time
-                    # 可以从配置中读取延迟时间，默认为0.5秒
-                    delay = 0.5
-                    time.sleep(delay)  # 每次请求间隔
-                    
-                    params = {
-                        "key": get_next_api_key(),
-                        "keywords": pcode,
-                        "subdistrict": 1,
-                        "extensions": "base",
-                    }
-                    
-                    # 添加重试机制
-                    max_retries = 3
-                    for retry in range(max_retries):
-                        try:
-                            r2 = requests.get(url, params=params, timeout=10)
-                            d2 = r2.json()
-                            if d2.get("status") == "1":
-                                break
-                            elif d2.get("info") == "CUQPS_HAS_EXCEEDED_THE_LIMIT":
-                                if retry < max_retries - 1:
-                                    print(f"API限制，等待重试... ({retry + 1}/{max_retries})")
-                                    time.sleep(2 * (retry + 1))  # 递增等待时间
-                                    continue
-                            else:
-                                break
-                        except Exception as e:
-                            if retry < max_retries - 1:
-                                print(f"请求失败，重试中... ({retry + 1}/{max_retries})")
-                                time.sleep(1)
-                                continue
-                            else:
-                                print(f"请求失败: {e}")
-                                break
-                    
-                    if d2.get("status") != "1":
-                        print(f"警告：加载 {pname} 的城市数据失败，状态：{d2.get('status')}，信息：{d2.get('info')}")
-                        continue
-                    cities = d2.get("districts", [])[0].get("districts", [])
-                    city_pairs = []
-                    for c in cities:
-                        cname = c.get("name")
-                        ccode = c.get("adcode")
-                        if not cname or not ccode:
-                            continue
-                        city_pairs.append((cname, ccode))
-                        city_name_to_adcode[cname] = ccode
-                    province_to_cities[pname] = city_pairs
-                    current_province += 1
-                    print(f"成功加载 {pname} 的 {len(city_pairs)} 个城市 ({current_province}/{total_provinces})")
+                province_to_cities, city_name_to_adcode, city_to_districts = self._load_region_tree(api_keys)
+                total = sum(len(pairs) for pairs in province_to_cities.values())
+                print(f"成功加载 {len(province_to_cities)} 个省份、{total} 个城市、"
+                      f"{sum(len(pairs) for pairs in city_to_districts.values())} 个区县")
 
                 # 手动添加可能缺失的直辖市数据
-                self._add_missing_municipalities(province_to_cities, city_name_to_adcode)
+                self._add_missing_municipalities(province_to_cities, city_name_to_adcode, city_to_districts)
 
             
                 def _populate_on_main_thread():
                     # 先写入配置文件
                     try:
-                        self.config_manager.update_provinces_data(province_to_cities, city_name_to_adcode)
+                        added, removed = self.config_manager.update_provinces_data(
+                            province_to_cities, city_name_to_adcode, city_to_districts,
+                            version="remote-" + datetime.now().strftime('%Y%m%d'))
                         self.config_manager.save_config()
+                        print(f"行政区划增量更新：新增 {added} 个、移除 {removed} 个区域，已有区域的查询状态保持不变")
                     except Exception as e:
                         print(f"保存省市数据到配置失败: {e}")
 
@@ -2286,9 +2019,8 @@ class AMapGUI:
                     try:
                         # 重建省份 UI，等待用户点击省份再展示城市
                         self.build_provinces_ui()
-                        provinces = self.config_manager.get_provinces()
-                        count = sum(len(p.get('cities', {})) for p in provinces.values())
-                        self.area_hint_label.config(text=f"已从配置加载{count}个城市数据，请先选择左侧省份。")
+                        count = len(self._all_region_names())
+                        self.area_hint_label.config(text=f"已从配置加载{count}个{self._region_unit()}数据，请先选择左侧省份。")
                     except Exception as e:
                         show_centered_message("错误", f"从配置加载省/市失败：{e}", "error", self.root)
 
@@ -2300,7 +2032,7 @@ class AMapGUI:
                     except Exception:
                         pass
 
-                self.root.after(0, _populate_on_main_thread)
+                self.ui_updates.post_call(_populate_on_main_thread)
             except Exception as e:
                 def _on_error():
                     show_centered_message("错误", f"加载省/市失败：{e}", "error", self.root)
@@ -2312,17 +2044,90 @@ class AMapGUI:
                             self.load_area_button.config(state='normal', text='加载省市数据')
                     except Exception:
                         pass
-                self.root.after(0, _on_error)
+                self.ui_updates.post_call(_on_error)
 
         threading.Thread(target=_load, daemon=True).start()
 
-    def _add_missing_municipalities(self, province_to_cities, city_name_to_adcode):
+    def _load_region_tree(self, api_keys):
+        """拉取全国省/市/区县三级行政区划，返回 (province_to_cities, city_name_to_adcode, city_to_districts)。
+
+        优先以 keywords=中国、subdistrict=3 一次取回整棵树；若失败（超时、响应不完整等），
+        先取省级列表，再由若干线程经 key 池限速并发拉取各省的市、区县两级。
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        settings = self.config_manager.get_user_settings()
+        key_pool = ApiKeyPool(api_keys, qps_per_key=settings.get('key_qps', 3.0))
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(max_retries=Retry(
+            total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])))
+
+        try:
+            data = self._request_district(session, key_pool, "中国", 3, timeout=30)
+            provinces = data["districts"][0]["districts"]
+            return parse_region_tree(provinces)
+        except Exception as e:
+            print(f"一次性加载行政区划失败（{e}），改为按省并发加载")
+
+        data = self._request_district(session, key_pool, "中国", 1)
+        provinces = data.get("districts", [])[0].get("districts", [])
+        results = {}
+        pending = queue.Queue()
+        for province in provinces:
+            pending.put(province)
+
+        def _worker():
+            # 每个线程使用独立的 Session
+            worker_session = requests.Session()
+            worker_session.mount("https://", HTTPAdapter(max_retries=Retry(
+                total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])))
+            while True:
+                try:
+                    province = pending.get_nowait()
+                except queue.Empty:
+                    return
+                pname = province.get("name")
+                try:
+                    d2 = self._request_district(worker_session, key_pool, province.get("adcode"), 2)
+                    results[province.get("adcode")] = d2.get("districts", [])[0]
+                except Exception as e:
+                    print(f"警告：加载 {pname} 的城市数据失败：{e}")
+                    results[province.get("adcode")] = {**province, "districts": []}
+
+        workers = max(1, int(settings.get('crawl_workers', 4) or 1))
+        threads = [threading.Thread(target=_worker, daemon=True) for _ in range(min(workers, len(provinces) or 1))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 保持接口返回的省份顺序
+        return parse_region_tree([results[p.get("adcode")] for p in provinces if p.get("adcode") in results])
+
+    def _request_district(self, session, key_pool, keywords, subdistrict, timeout=10):
+        """请求一次行政区划接口，key 限额或 QPS 超限时经 key 池换 key 重试；失败抛出 RuntimeError。"""
+        params = {"keywords": keywords, "subdistrict": subdistrict, "extensions": "base"}
+        while True:
+            api_key = key_pool.acquire()
+            if api_key is None:
+                raise RuntimeError("所有 key 都已不可用")
+            data = session.get(CrawlEngine.DISTRICT_URL, params={**params, "key": api_key}, timeout=timeout).json()
+            if data.get("status") == "1" and data.get("districts"):
+                return data
+            if data.get("status") == "0" and key_pool.report_error(api_key, data.get("info")):
+                print(f"key {api_key} 返回 {data.get('info')}，换 key 重试")
+                continue
+            raise RuntimeError(f"加载行政区划失败: {data.get('info')}")
+
+    def _add_missing_municipalities(self, province_to_cities, city_name_to_adcode, city_to_districts=None):
         """手动添加可能缺失的直辖市与台湾省数据，规范化市级展示。
 
         目的：
         - 高德行政区划接口对直辖市返回区县列表，UI 期望“城市”层级；
         - 某些环境下台湾省可能无法返回，需要手动补充；
-        - 将直辖市在本工具内统一作为一个“城市”选项，便于检索。
+        - 将直辖市在本工具内统一作为一个“城市”选项，便于检索；
+          其下（如“北京城区”）的区县合并到该城市的区县列表中（city_to_districts）。
         """
         # 规范化直辖市：将其城市列表设置为仅包含自身（市级 adcode）
         municipalities = {
@@ -2342,6 +2147,13 @@ class AMapGUI:
                 if not (len(existing_city_pairs) == 1 and existing_city_pairs[0][0] == muni_name):
                     need_override = True
             if need_override:
+                if city_to_districts is not None:
+                    merged = list(city_to_districts.get(muni_code, []))
+                    for child_name, child_code in province_to_cities.get(muni_name) or []:
+                        if child_code != muni_code:
+                            merged.extend(city_to_districts.pop(child_code, []) or [(child_name, child_code)])
+                    if merged:
+                        city_to_districts[muni_code] = merged
                 province_to_cities[muni_name] = [(muni_name, muni_code)]
             # 同步城市名称到编码映射
             city_name_to_adcode[muni_name] = muni_code
@@ -2401,11 +2213,11 @@ class AMapGUI:
             child.destroy()
         self.city_checkbuttons.clear()
         
-        # 从配置中获取所有城市
-        all_cities = self.config_manager.get_all_cities()
+        # 从配置中获取当前层级的所有区域
+        all_cities = self._all_region_names()
         
         # 为所有城市创建复选框
-        for city_name in sorted(all_cities.keys()):
+        for city_name in sorted(all_cities):
             if city_name not in self.city_vars:
                 self.city_vars[city_name] = tk.BooleanVar()
             var = self.city_vars[city_name]
@@ -2417,6 +2229,31 @@ class AMapGUI:
         # 更新统计信息
         self.area_hint_label.config(text=f"可选择{len(all_cities)}个城市")
 
+    def _all_region_names(self):
+        """当前检索层级（城市或区县）下全部可选区域的名称。"""
+        return [name for _, name, _ in self.config_manager.iter_region_records(self.region_level)]
+
+    def _region_unit(self):
+        return "区县" if self.region_level == 'district' else "城市"
+
+    def on_region_level_changed(self):
+        """切换检索层级（城市 / 区县）：保存设置，清空当前勾选并按新层级重建列表。"""
+        level = 'district' if self.region_level_var.get() else 'city'
+        if level == 'district' and not self.config_manager.has_districts():
+            self.region_level_var.set(False)
+            show_centered_message("提示", "当前配置中没有区县数据，请先点击“加载省市数据”重新加载。", "info", self.root)
+            return
+        self.region_level = level
+        self.config_manager.update_user_settings({'region_level': level})
+        self.config_manager.save_config()
+        self.province_to_cities = {}
+        self.city_name_to_adcode = {}
+        self.city_vars.clear()
+        self.selected_cities.clear()
+        self.select_all_var.set(False)
+        self.build_provinces_ui()
+        self.update_progress(len(self._all_region_names()))
+
     def build_provinces_ui(self):
         """根据配置构建省份复选框列表。
         数据来源：ConfigManager.provinces，优先使用已缓存数据；
@@ -2456,18 +2293,17 @@ class AMapGUI:
         """从现有配置中填充 province_to_cities 字典，确保城市数据立即可用"""
         try:
             provinces = self.config_manager.get_provinces()
-            for province_name, province_data in provinces.items():
-                cities = province_data.get("cities", {})
-                if cities:
-                    city_pairs = []
-                    for city_name, city_data in cities.items():
-                        city_code = city_data.get("adcode")
-                        if city_name and city_code:
-                            city_pairs.append((city_name, city_code))
-                            self.city_name_to_adcode[city_name] = city_code
-                    if city_pairs:
-                        self.province_to_cities[province_name] = city_pairs
-                        print(f"从配置加载 {province_name} 的 {len(city_pairs)} 个城市")
+            total = 0
+            for province_name in provinces:
+                city_pairs = []
+                for city_code, city_name in self.config_manager.iter_regions(province_name, self.region_level):
+                    city_pairs.append((city_name, city_code))
+                    self.city_name_to_adcode[city_name] = city_code
+                if city_pairs:
+                    self.province_to_cities[province_name] = city_pairs
+                    total += len(city_pairs)
+            # 汇总为一行输出，逐省打印会拖慢启动（Windows 控制台尤甚）
+            print(f"从配置加载 {len(self.province_to_cities)} 个省份的 {total} 个{self._region_unit()}")
         except Exception as e:
             print(f"从配置填充省市数据失败：{e}")
 
@@ -2479,7 +2315,7 @@ class AMapGUI:
         if not province_cities:
             # 若未填充 province_to_cities，则根据配置构造（统一转换）
             city_pairs = []
-            for code, name in self.config_manager.iter_cities(province_name):
+            for code, name in self.config_manager.iter_regions(province_name, self.region_level):
                 city_pairs.append((name, code))
             province_cities = city_pairs
             self.province_to_cities[province_name] = city_pairs
@@ -2503,12 +2339,8 @@ class AMapGUI:
         total_in_province = len(province_cities)
         selected_in_province = sum(1 for city_name, _ in province_cities if city_name in self.city_vars and self.city_vars[city_name].get())
         # 计算全局已选数量
-        provinces = self.config_manager.get_provinces()
-        total_selected_global = 0
-        for p in provinces.values():
-            for city_name, city_data in p.get('cities', {}).items():
-                if city_name and city_name in self.city_vars and self.city_vars[city_name].get():
-                    total_selected_global += 1
+        total_selected_global = sum(1 for city_name in self._all_region_names()
+                                    if city_name in self.city_vars and self.city_vars[city_name].get())
         self.area_hint_label.config(text=f"{province_name}：可选择{total_in_province}个城市 / 已选择{total_selected_global}市")
         # 切换省份后，同步右上角"查询所有市"二态勾选状态
         if hasattr(self, 'select_all_cities_var'):
@@ -2524,7 +2356,7 @@ class AMapGUI:
         if not province_cities:
             # 同步填充（统一转换）
             city_pairs = []
-            for code, name in self.config_manager.iter_cities(province_name):
+            for code, name in self.config_manager.iter_regions(province_name, self.region_level):
                 city_pairs.append((name, code))
             province_cities = city_pairs
             self.province_to_cities[province_name] = city_pairs
@@ -2596,24 +2428,20 @@ class AMapGUI:
             self.update_all_cities_check_state()
         
         # 更新状态文案：显示当前省可选择数量 + 全局已选数量
-        provinces = self.config_manager.get_provinces()
-        total_selected_global = 0
-        for p in provinces.values():
-            for city_name, city_data in p.get('cities', {}).items():
-                if city_name and city_name in self.city_vars and self.city_vars[city_name].get():
-                    total_selected_global += 1
+        total_selected_global = sum(1 for city_name in self._all_region_names()
+                                    if city_name in self.city_vars and self.city_vars[city_name].get())
         # 当前省可选择数量（若未选中某省，则显示全部城市数）
         if getattr(self, 'current_province_name', None):
             province_cities = self.province_to_cities.get(self.current_province_name)
             if not province_cities:
                 city_pairs = []
-                for code, name in self.config_manager.iter_cities(self.current_province_name):
+                for code, name in self.config_manager.iter_regions(self.current_province_name, self.region_level):
                     city_pairs.append((name, code))
                 province_cities = city_pairs
             total_in_province = len(province_cities)
             prefix = f"{self.current_province_name}：可选择{total_in_province}个城市"
         else:
-            total_all = sum(len(p.get('cities', {})) for p in provinces.values())
+            total_all = len(self._all_region_names())
             prefix = f"全部：可选择{total_all}个城市"
         self.area_hint_label.config(text=f"{prefix} / 已选择{total_selected_global}市")
 
@@ -2634,7 +2462,7 @@ class AMapGUI:
             if not province_cities:
                 # 若未缓存，则从配置构造并回填，确保三态可计算
                 city_pairs = []
-                for code, name in self.config_manager.iter_cities(province_name):
+                for code, name in self.config_manager.iter_regions(province_name, self.region_level):
                     city_pairs.append((name, code))
                 province_cities = city_pairs
                 if not hasattr(self, 'province_to_cities'):
@@ -2659,12 +2487,8 @@ class AMapGUI:
                 province_cb.set_state("partial")
                 
         # 更新统计信息（以全局省市为准，而非仅右侧可见城市）
-        provinces = self.config_manager.get_provinces()
-        total_selected_global = 0
-        for p in provinces.values():
-            for city_name, city_data in p.get('cities', {}).items():
-                if city_name and city_name in self.city_vars and self.city_vars[city_name].get():
-                    total_selected_global += 1
+        total_selected_global = sum(1 for city_name in self._all_region_names()
+                                    if city_name in self.city_vars and self.city_vars[city_name].get())
         self.area_hint_label.config(text=f"已选{total_selected_global}市")
 
     def update_all_provinces_check_state(self):
@@ -2672,16 +2496,12 @@ class AMapGUI:
         逻辑：遍历配置中的所有城市，若全部被选中则勾上，否则取消。
         与右侧可见城市无关，保证在操作省份时也能实时准确。
         """
-        provinces = self.config_manager.get_provinces()
         total = 0
         checked = 0
-        for p in provinces.values():
-            for city_name, city_data in p.get('cities', {}).items():
-                if not city_name:
-                    continue
-                total += 1
-                if city_name in self.city_vars and self.city_vars[city_name].get():
-                    checked += 1
+        for city_name in self._all_region_names():
+            total += 1
+            if city_name in self.city_vars and self.city_vars[city_name].get():
+                checked += 1
         self.select_all_var.set(total > 0 and checked == total)
 
     def update_all_cities_check_state(self):
@@ -2731,9 +2551,8 @@ class AMapGUI:
             
             # 重建省份 UI
             self.build_provinces_ui()
-            provinces = self.config_manager.get_provinces()
-            count = sum(len(p.get('cities', {})) for p in provinces.values())
-            self.area_hint_label.config(text=f"已从配置加载{count}个城市数据，请先选择左侧省份。")
+            count = len(self._all_region_names())
+            self.area_hint_label.config(text=f"已从配置加载{count}个{self._region_unit()}数据，请先选择左侧省份。")
             return True
             
         except Exception as e:
@@ -2743,52 +2562,39 @@ class AMapGUI:
     
     
 
-    def export_to_csv_realtime(self, pois):
-        """按所选字段实时追加写入 CSV（UTF-8 BOM）。"""
+    def open_realtime_sink(self, selected_fields):
+        """开启实时导出写入线程（每轮检索一个），未勾选实时导出时不创建。"""
+        self.csv_sink = None
+        if not self.realtime_export_var.get():
+            return
         realtime_export_path = self.realtime_export_path_entry.get().strip()
         if not realtime_export_path:
-            realtime_export_path = "realtime_export.csv" 
-        
-        # 获取用户选择的字段
-        selected_fields = [(chinese, english) for chinese, (english, var) in self.fields.items() if var.get()]
+            realtime_export_path = "realtime_export.csv"
+
+        def _on_error(path, error):
+            # 在写入线程中调用：经界面更新队列交给主线程弹窗
+            self.ui_updates.post_call(lambda: show_centered_message(
+                "警告", f"无法写入文件 '{path}'，请检查文件是否已被占用或没有写权限。", "warning", self.root))
+
+        settings = self.config_manager.get_user_settings()
+        self.csv_sink = CsvSink(
+            realtime_export_path, selected_fields,
+            flush_interval=settings.get('realtime_export_flush_interval', 1.0),
+            on_error=_on_error,
+        )
 
-        # 判断文件是否被占用或没有权限
-        try:
-            with open(realtime_export_path, 'a', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.writer(csvfile)
-                if os.path.getsize(realtime_export_path) == 0: 
-                    header = [chinese for chinese, _ in selected_fields]
-                    writer.writerow(header)
-                for poi in pois:
-                    # 若所有选中字段均为空列表或等价于空，则整行不写入
-                    raw_values = []
-                    for _, english in selected_fields:
-                        v = poi.get(english, '')
-                        raw_values.append(v)
-                    all_empty = True
-                    for v in raw_values:
-                        if v not in (None, '', '[]'):
-                            # 处理真正的空列表类型
-                            if isinstance(v, list) and len(v) == 0:
-                                pass
-                            else:
-                                all_empty = False
-                                break
-                    if all_empty:
-                        continue
+    def close_realtime_sink(self):
+        """写完剩余数据并关闭实时导出文件。"""
+        sink = getattr(self, 'csv_sink', None)
+        self.csv_sink = None
+        if sink is not None:
+            sink.close()
 
-                    row = []
-                    for _, english in selected_fields:
-                        value = poi.get(english, '')
-                        # 将空列表表现形式置空
-                        if value == "[]" or (isinstance(value, list) and len(value) == 0):
-                            row.append('')
-                        else:
-                            row.append(value)
-                    writer.writerow(row)
-        except PermissionError as e:
-            print(f"文件 '{realtime_export_path}' 被占用或没有写权限: {str(e)}")
-            show_centered_message("警告", f"无法写入文件 '{realtime_export_path}'，请检查文件是否已被占用或没有写权限。", "warning", self.root)
+    def export_to_csv_realtime(self, pois):
+        """将一页 POI 交给实时导出写入线程（按本轮开始时所选字段写入）。"""
+        sink = getattr(self, 'csv_sink', None)
+        if sink is not None:
+            sink.put(pois)
     
     def stop_search(self):
         """优雅停止当前检索，并在输出中插入分隔。"""
@@ -2797,8 +2603,8 @@ class AMapGUI:
         if hasattr(self, 'pause_button'):
             self.pause_button.configure(state='disabled', text='暂停')
         self.insert_text(self.frame1, "用户主动终止查询.\n")
-        self.insert_text(self.frame2, "\n")
-        self.insert_text(self.frame3, "\n")
+        # 停止时立即落盘已完成城市的查询状态
+        self.config_manager.flush()
         
         # 更新进度显示为已查询的城市数量
         try:
@@ -2807,6 +2613,20 @@ class AMapGUI:
         except Exception as e:
             print(f"更新进度显示失败: {e}")
 
+    def on_close(self):
+        """关闭主窗口：终止检索，写完实时导出队列，并强制保存未落盘的查询状态与结果。"""
+        self.is_searching = False
+        self.is_paused = False
+        # 先停止接收新页，再提交结果库（最后一批随之交给实时导出），最后写完写入线程中排队的行：
+        # 这些页的断点已提交，续跑时不会再次导出
+        with self._dispatch_lock:
+            self._closing = True
+        if getattr(self, 'poi_store', None) is not None:
+            self.poi_store.flush()
+        self.close_realtime_sink()
+        self.config_manager.flush()
+        self.root.destroy()
+
     def toggle_pause(self):
         """切换暂停/继续状态，影响搜索循环与分页循环。"""
         if not self.is_searching:
@@ -2819,16 +2639,30 @@ class AMapGUI:
             self.pause_button.configure(text='暂停')
             self.insert_text(self.frame1, "已继续查询\n")
         
-    def get_next_unqueried_city(self):
-        """返回下一个未查询城市名称（基于配置）；若全部查询过则返回 None。"""
-        provinces = self.config_manager.get_provinces()
-        for p in provinces.values():
-            for code, c in p.get('cities', {}).items():
-                city_name = c.get('name')
-                if city_name and not c.get('queried'):
-                    return city_name
+    def get_next_unqueried_city(self, keyword=None):
+        """返回当前关键词（缺省取输入框，多个时任一未查询即算）下一个未查询的区域名称；若全部查询过则返回 None。"""
+        keywords = [keyword] if keyword else (self.active_keywords() or [None])
+        for _, region_name, record in self.config_manager.iter_region_records(self.region_level):
+            if not all(self.config_manager.is_queried(record.get('adcode'), kw) for kw in keywords):
+                return region_name
         return None
 
+    def active_keywords(self):
+        """输入框中的当前关键词列表（按逗号、顿号等拆分）；为空或仍是占位提示时返回空列表。"""
+        if not hasattr(self, 'keyword_entry'):
+            return []
+        text = self.keyword_entry.get().strip()
+        if text == self.KEYWORD_PLACEHOLDER:
+            return []
+        return split_keywords(text)
+
+    def _selected_fields(self):
+        """用户勾选的导出字段 [(中文名, 英文名), ...]；多关键词检索时在最前面加上“关键词”列。"""
+        selected_fields = [(chinese, english) for chinese, (english, var) in self.fields.items() if var.get()]
+        if selected_fields and getattr(self, 'keyword_column', False):
+            selected_fields.insert(0, ("关键词", "keyword"))
+        return selected_fields
+
     def save_queried_cities(self):
         """将内存中的已查询城市同步写入配置文件（兼容旧流程，当前无实际写入）。"""
         # 在这里不需要具体实现，因为查询状态在search_pois中实时更新
@@ -2837,12 +2671,12 @@ class AMapGUI:
 
     def export_csv(self):
         """通过"另存为"导出汇总 POI，使用用户勾选的字段设置。"""
-        if not hasattr(self, 'pois_data'):
+        if getattr(self, 'current_run_id', None) is None or self.poi_store.count(self.current_run_id) == 0:
             show_centered_message("警告", "没有数据可导出，请先进行查询。", "warning", self.root)
             return
         
         # 获取用户选择的字段，与实时导出保持一致
-        selected_fields = [(chinese, english) for chinese, (english, var) in self.fields.items() if var.get()]
+        selected_fields = self._selected_fields()
         
         if not selected_fields:
             show_centered_message("警告", "请至少选择一个字段进行导出。", "warning", self.root)
@@ -2850,54 +2684,40 @@ class AMapGUI:
         
         filepath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
         if filepath:
+            import csv
             with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
                 writer = csv.writer(csvfile)
                 # 写入表头，使用用户选择的中文字段名
                 header = [chinese for chinese, _ in selected_fields]
                 writer.writerow(header)
                 
-                # 写入数据，使用用户选择的英文字段名
-                for poi in self.pois_data:
+                # 写入数据，使用用户选择的英文字段名（从结果库流式读取本轮结果）
+                with_keyword = getattr(self, 'keyword_column', False)
+                for poi in self.poi_store.iter_pois(self.current_run_id, with_keyword=with_keyword):
                     # 若所有选中字段均为空列表或等价于空，则整行不写入
-                    raw_values = []
-                    for _, english in selected_fields:
-                        v = poi.get(english, '')
-                        raw_values.append(v)
-                    all_empty = True
-                    for v in raw_values:
-                        if v not in (None, '', '[]'):
-                            if isinstance(v, list) and len(v) == 0:
-                                pass
-                            else:
-                                all_empty = False
-                                break
-                    if all_empty:
-                        continue
-
-                    row = []
-                    for _, english in selected_fields:
-                        value = poi.get(english, '')
-                        if value == "[]" or (isinstance(value, list) and len(value) == 0):
-                            row.append('')
-                        else:
-                            row.append(value)
-                    writer.writerow(row)
+                    row = poi_to_csv_row(poi, selected_fields)
+                    if row is not None:
+                        writer.writerow(row)
             show_centered_message("提示", "导出完成", "info", self.root)
 
     def reset_cities_status(self):
-        """清空已查询城市记录与标记，并刷新界面列表。"""
+        """清空已查询城市记录与标记（输入了关键词时只清空这些关键词的进度），并刷新界面列表。"""
         try:
-            # 使用ConfigManager重置所有查询状态
-            self.config_manager.reset_all_query_status()
+            keywords = self.active_keywords()
+            # 使用ConfigManager重置查询状态
+            for keyword in keywords or [None]:
+                self.config_manager.reset_all_query_status(keyword)
                         
             # 保存更新后的配置
             self.config_manager.save_config()
             
             # 更新进度显示
-            total = sum(len(p.get('cities', {})) for p in self.config_manager.get_provinces().values())
-            self.update_progress(total)
+            self.update_progress(len(self._all_region_names()))
             
-            show_centered_message("提示", "所有城市状态已恢复为未查询", "info", self.root)
+            if keywords:
+                show_centered_message("提示", f"关键词“{'、'.join(keywords)}”的查询进度已恢复为未查询", "info", self.root)
+            else:
+                show_centered_message("提示", "所有城市状态已恢复为未查询", "info", self.root)
             
         except Exception as e:
             show_centered_message("错误", f"重置状态失败：{str(e)}", "error", self.root)
@@ -2906,15 +2726,12 @@ class AMapGUI:
 
 if __name__ == "__main__":
     root = tk.Tk()
+    mark_startup("创建主窗口")
     # 设置窗口/任务栏图标，兼容 PyInstaller 单文件
-    def _resource_path(relative_path: str) -> str:
-        base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
-        return os.path.join(base_path, relative_path)
-
     try:
         icon_path = None
-        for name in ("app.ico"):
-            p = _resource_path(name)
+        for name in ("app.ico",):
+            p = resource_path(name)
             if os.path.exists(p):
                 icon_path = p
                 break
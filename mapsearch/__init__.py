@@ -0,0 +1,42 @@
+# MapSearch：高德地图（AMap）POI 批量检索。
+#
+# 图形界面见项目根目录的 main.py；无图形环境时可使用命令行入口：
+#   python -m mapsearch crawl --key KEY --keyword 咖啡 --region 北京市 --output result.csv
+# 或在程序中流式消费结果：
+#   for poi in MapSearchClient(["KEY"]).iter_pois("咖啡", ["110000"]): ...
+
+from .core import (
+    POI_FIELDS,
+    ApiKeyPool,
+    ConfigManager,
+    CrawlEngine,
+    CsvSink,
+    PoiStore,
+    ResponseCache,
+    TaskQueue,
+    TokenBucket,
+    parse_region_tree,
+    parse_subdistricts,
+    poi_to_csv_row,
+    resource_path,
+    split_keywords,
+)
+from .client import MapSearchClient
+
+__all__ = [
+    "MapSearchClient",
+    "POI_FIELDS",
+    "ApiKeyPool",
+    "ConfigManager",
+    "CrawlEngine",
+    "CsvSink",
+    "PoiStore",
+    "ResponseCache",
+    "TaskQueue",
+    "TokenBucket",
+    "parse_region_tree",
+    "parse_subdistricts",
+    "poi_to_csv_row",
+    "resource_path",
+    "split_keywords",
+]
@@ -0,0 +1,166 @@
+# MapSearch asyncio 检索引擎（可选，需要 aiohttp：uv sync --extra async 或 pip install aiohttp）。
+#
+# 在单个事件循环上保持大量并发请求，线程数与内存不随并发数增长；
+# 任务队列、Key 池与限速、响应缓存、饱和下钻与下游回调的语义与 CrawlEngine 完全相同。
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import _LAST_ERROR, CrawlEngine
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖
+    aiohttp = None
+
+
+class AsyncCrawlEngine(CrawlEngine):
+    """基于 asyncio + aiohttp 的检索引擎：concurrency 个协程从任务队列领取页并发抓取。
+
+    run(jobs) 在新的事件循环中运行，接口与 CrawlEngine 一致，可直接替换；
+    已在事件循环中时改用 await run_async(jobs)。
+    任务队列、结果库与响应缓存的 SQLite 读写以及所有回调都在一个专用的写入线程中依次执行，不阻塞事件循环：
+    下游处理变慢时，协程在等待写入线程时挂起（不再领取新页），在途请求照常完成，不会因事件循环停顿而超时。
+    """
+
+    def __init__(self, key_pool, concurrency=64, **kwargs):
+        if aiohttp is None:
+            raise RuntimeError("asyncio 引擎需要安装 aiohttp：uv sync --extra async 或 pip install aiohttp")
+        super().__init__(key_pool, **kwargs)
+        self.concurrency = max(1, int(concurrency or 1))
+        self._http = None
+        self._io = None  # 写入线程
+
+    def run(self, jobs):
+        return asyncio.run(self.run_async(jobs))
+
+    async def run_async(self, jobs):
+        """并发抓取 jobs（[(关键词, 城市名, adcode), ...]），返回抓取到的 POI 条数。"""
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mapsearch-io')
+        try:
+            await self._blocking(self._prepare, jobs)
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            timeout = aiohttp.ClientTimeout(total=10)
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+                self._http = http
+                try:
+                    await asyncio.gather(*(self._worker_async() for _ in range(self.concurrency)))
+                finally:
+                    self._http = None
+            return await self._blocking(self._finish_run)
+        finally:
+            self._io.shutdown(wait=True)
+            self._io = None
+
+    async def _blocking(self, func, *args):
+        """在写入线程中执行阻塞调用并等待结果；沿用当前协程的 _LAST_ERROR，并取回调用中记录的失败原因。"""
+        context = contextvars.copy_context()
+        result = await asyncio.get_running_loop().run_in_executor(self._io, context.run, func, *args)
+        _LAST_ERROR.set(context.get(_LAST_ERROR))
+        return result
+
+    def _log(self, text):
+        # 事件循环线程中的日志交给写入线程按序输出，不等待 on_log 返回
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return super()._log(text)
+        self._io.submit(CrawlEngine._log, self, text)
+
+    async def _worker_async(self):
+        while self._should_continue():
+            while self.is_paused is not None and self.is_paused() and self._should_continue():
+                await asyncio.sleep(0.2)
+            task = await self._blocking(self._tasks.lease, self._run_token)
+            if task is None:
+                # 暂无到期任务：仍在抓取的第 1 页可能派生新任务，退避中的任务到期后再领取
+                remaining, wait = await self._blocking(self._tasks.outstanding, self._run_token)
+                if remaining == 0:
+                    return
+                await asyncio.sleep(min(max(wait, 0.05), 0.5))
+                continue
+            await self._run_page_async(task)
+
+    async def _run_page_async(self, task):
+        """抓取一页（首页饱和时取下级区域），再交给 _finish_page 更新任务状态。"""
+        keyword, region_code, page_num = task
+        _LAST_ERROR.set(None)
+        name = self._nodes[(keyword, region_code)]["name"]
+        pois, total, children = None, 0, None
+        resumed = (keyword, region_code, page_num) in self.done_pages
+        if self._should_continue():
+            try:
+                if resumed:
+                    pois, total = self._resume_page(task)
+                else:
+                    pois, total = await self._fetch_page_async(keyword, name, region_code, page_num)
+                if page_num == 1 and pois is not None and total >= self.RESULT_CEILING:
+                    children = await self._load_subdistricts_async(name, region_code)
+                    if children is None:
+                        pois = None
+            except Exception as e:
+                self._log(f"{name} 第 {page_num} 页查询失败：{e}\n")
+                _LAST_ERROR.set(str(e))
+                pois = None
+        await self._blocking(self._finish_page, task, pois, total, children or [], resumed)
+
+    async def _acquire_key_async(self):
+        """异步等待某个 key 有余量（与 ApiKeyPool.acquire 相同的限速与额度规则）；用尽或被停止返回 None。"""
+        while True:
+            api_key, wait = self.key_pool.try_acquire()
+            if api_key is not None:
+                return api_key
+            if wait is None or not self._should_continue():
+                self._check_exhausted()
+                return None
+            await asyncio.sleep(min(wait, 0.2))
+
+    async def _get_json(self, url, params):
+        """发送 GET 请求，返回 (HTTP 状态码, JSON)。"""
+        async with self._http.get(url, params=params) as response:
+            return response.status, await response.json(content_type=None)
+
+    async def _fetch_page_async(self, keyword, region, region_code, page_num):
+        params = self._place_params(keyword, region, region_code, page_num)
+        while True:
+            if not self._should_continue():
+                return None, 0
+            data = await self._blocking(self.cache.get, self.PLACE_TEXT_URL, params) if self.cache is not None else None
+            # 缓存命中：不占用 key 配额与限速
+            api_key, status_code = None, 200
+            if data is None:
+                api_key = await self._acquire_key_async()
+                if api_key is None:
+                    return None, 0
+                try:
+                    status_code, data = await self._get_json(self.PLACE_TEXT_URL, {**params, "key": api_key})
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    self._request_failed(f"{region} 第 {page_num} 页请求失败", e)
+                    return None, 0
+            result = await self._blocking(self._place_result, region, page_num, params, api_key, status_code, data)
+            if result is not self._RETRY:
+                return result
+
+    async def _load_subdistricts_async(self, name, region_code):
+        children = self._cached_subdistricts(region_code)
+        if children is not None:
+            return children
+        params = {"keywords": region_code, "subdistrict": 2, "extensions": "base"}
+        while True:
+            if not self._should_continue():
+                return None
+            data = await self._blocking(self.cache.get, self.DISTRICT_URL, params) if self.cache is not None else None
+            api_key = None
+            if data is None:
+                api_key = await self._acquire_key_async()
+                if api_key is None:
+                    return None
+                try:
+                    _, data = await self._get_json(self.DISTRICT_URL, {**params, "key": api_key})
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    self._request_failed(f"{name} 行政区划请求失败", e)
+                    return None
+            result = await self._blocking(self._district_result, name, region_code, params, api_key, data)
+            if result is not self._RETRY:
+                return result
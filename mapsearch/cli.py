@@ -0,0 +1,239 @@
+# MapSearch 命令行入口：在没有图形环境的服务器或 cron 中执行检索。
+#
+#   python -m mapsearch crawl --key KEY1 --key KEY2 --keyword 咖啡,奶茶 \
+#       --region 广东省 --region 110000 --output result.csv
+#
+# 与图形界面共用 config.json（查询进度、字段设置、限速与去重等设置）、结果库、任务队列与响应缓存，
+# 不创建任何 Tk 对象。
+
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+
+from .core import (
+    POI_FIELDS, ApiKeyPool, ConfigManager, CrawlEngine, CsvSink, PoiStore, ResponseCache, TaskQueue,
+    create_crawl_engine, split_keywords,
+)
+
+KEY_PLACEHOLDER = '可输入多个key，每个key用空格隔开'
+
+
+def parse_fields(text, field_settings):
+    """解析 --fields（逗号分隔的中文列名或接口字段名）；未指定时使用配置中勾选的字段。"""
+    if not text:
+        return [(chinese, english) for chinese, english in POI_FIELDS if field_settings.get(chinese)]
+    by_name = {}
+    for chinese, english in POI_FIELDS:
+        by_name[chinese] = by_name[english] = (chinese, english)
+    fields = []
+    for name in split_keywords(text):
+        if name not in by_name:
+            raise ValueError(f"未知字段：{name}（可选：{'、'.join(chinese for chinese, _ in POI_FIELDS)}）")
+        fields.append(by_name[name])
+    return list(dict.fromkeys(fields))
+
+
+class CrawlStats:
+    """命令行检索的吞吐统计：抓取/新增 POI 数、完成区域数与请求数（线程安全）。"""
+
+    def __init__(self, key_pool, total_jobs):
+        self.key_pool = key_pool
+        self.total_jobs = total_jobs
+        self.started = time.monotonic()
+        self.fetched = 0
+        self.fresh = 0
+        self.jobs_done = 0
+        self._requests_base = self._requests_used()
+        self._lock = threading.Lock()
+
+    def _requests_used(self):
+        return sum(used for _, used, _ in self.key_pool.summary())
+
+    def add_page(self, fetched, fresh):
+        with self._lock:
+            self.fetched += fetched
+            self.fresh += fresh
+
+    def add_job(self):
+        with self._lock:
+            self.jobs_done += 1
+
+    def line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        requests_made = self._requests_used() - self._requests_base
+        return (f"[{elapsed:7.1f}s] 区域 {self.jobs_done}/{self.total_jobs}  "
+                f"POI {self.fetched}（新增 {self.fresh}）  {self.fetched / elapsed:.1f} 条/秒  "
+                f"请求 {requests_made}（{requests_made / elapsed:.2f} 次/秒）")
+
+
+def crawl(args):
+    """执行一次检索，返回进程退出码：0 全部完成，1 有区域未完成（失败、被中断或 key 用尽），2 参数错误。"""
+    # --quiet 时配置、引擎与 key 池的提示都不输出，标准输出只保留统计行
+    log = None if args.quiet else (lambda text: print(text, end='' if text.endswith('\n') else '\n'))
+    config_manager = ConfigManager(args.config, on_log=log)
+    settings = config_manager.get_user_settings()
+
+    keys = [key for text in (args.key or [settings.get('api_keys', '')])
+            for key in split_keywords(text.replace(' ', ',')) if key != KEY_PLACEHOLDER]
+    keywords = split_keywords(",".join(args.keyword))
+    level = args.level or settings.get('region_level', 'city')
+    try:
+        regions = config_manager.resolve_regions(args.region or ['all'], level)
+        selected_fields = parse_fields(args.fields, config_manager.get_field_settings())
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 2
+    if not keys or not keywords or not regions:
+        print("错误：API Key、关键词与区域都不能为空", file=sys.stderr)
+        return 2
+    if args.output and not selected_fields:
+        print("错误：请至少选择一个导出字段（--fields 或配置中的字段设置）", file=sys.stderr)
+        return 2
+
+    jobs = [(keyword, name, code) for keyword in keywords for name, code in regions]
+    if args.skip_queried:
+        jobs = [job for job in jobs if not config_manager.is_queried(job[2], job[0])]
+    # 多关键词时导出增加“关键词”列，与图形界面一致
+    keyword_column = len(keywords) > 1
+    if keyword_column and selected_fields:
+        selected_fields.insert(0, ("关键词", "keyword"))
+    dedup_scope = args.dedup or settings.get('dedup_scope', 'run')
+
+    key_pool = ApiKeyPool(keys, qps_per_key=args.qps or settings.get('key_qps', 3.0),
+                          daily_quota=settings.get('key_daily_quota', 0))
+    try:
+        store = PoiStore(args.db or settings.get('result_db') or 'results.db')
+        tasks = TaskQueue(settings.get('task_queue_db') or 'task_queue.db',
+                          max_attempts=settings.get('task_max_attempts', 5))
+    except sqlite3.Error as e:
+        print(f"错误：打开结果库或任务队列失败：{e}", file=sys.stderr)
+        return 1
+    cache = None
+    ttl_hours = float(settings.get('response_cache_ttl_hours', 24) or 0)
+    if not args.no_cache and ttl_hours > 0:
+        cache = ResponseCache(settings.get('response_cache_db') or 'response_cache.db',
+                              ttl_seconds=ttl_hours * 3600,
+                              max_entries=settings.get('response_cache_max_entries', 50000))
+    sink = None
+    if args.output:
+        sink = CsvSink(args.output, selected_fields,
+                       flush_interval=settings.get('realtime_export_flush_interval', 1.0))
+
+    # 本次任务中有上次中断留下的页断点时沿用原轮次，续跑结果与中断前的结果同属一轮；
+    # 属于其他轮次或已过期的断点连同任务队列记录一起清除，这些区域从第 1 页重新抓取
+    job_roots = [(keyword, code) for keyword, _, code in jobs]
+    run_id = store.resumable_run(job_roots) or store.begin_run(",".join(keywords))
+    for keyword, root in store.discard_stale_checkpoints(job_roots, run_id):
+        tasks.clear(keyword, root)
+    stats = CrawlStats(key_pool, len(jobs))
+    stop = threading.Event()
+
+    def _on_pois(keyword, region, region_code, pois, cursor, done):
+        def _committed(fresh):
+            # 本页所在批次（连同页断点）提交后才写入 CSV，续跑时不会重复导出；随后通知引擎本页已落盘
+            if sink is not None and fresh:
+                sink.put([dict(poi, keyword=keyword) for poi in fresh] if keyword_column else fresh)
+            done()
+
+        fresh = store.add(run_id, keyword, region_code, pois, dedup=dedup_scope, cursor=cursor,
+                          on_commit=_committed)
+        stats.add_page(len(pois), len(fresh))
+
+    def _on_city_done(keyword, region, region_code, count):
+        province_name = (config_manager.find_province_by_city_code(region_code)
+                         or config_manager.find_city(region)[0])
+        config_manager.update_city_query_status(province_name, region_code, region, True, keyword=keyword)
+        store.clear_checkpoints(keyword, region_code)
+        stats.add_job()
+
+    try:
+        engine = create_crawl_engine(
+            args.engine or settings.get('crawl_engine', 'thread'),
+            key_pool,
+            concurrency=args.concurrency or settings.get('async_concurrency', 64),
+            workers=args.workers or settings.get('crawl_workers', 4),
+            on_log=log,
+            on_pois=_on_pois,
+            on_city_done=_on_city_done,
+            is_running=lambda: not stop.is_set(),
+            cache=cache,
+            done_pages=store.load_checkpoints(job_roots),
+            task_queue=tasks,
+        )
+    except RuntimeError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 2
+    print(f"开始检索：{len(keywords)} 个关键词 × {len(regions)} 个区域，共 {len(jobs)} 个任务，{len(key_pool)} 个 key")
+    runner = threading.Thread(target=engine.run, args=(jobs,), daemon=True)
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(args.stats_interval)
+            if runner.is_alive():
+                print(stats.line(), flush=True)
+    except KeyboardInterrupt:
+        print("收到中断信号，正在停止（已完成的页会保留，下次可继续）…", flush=True)
+        stop.set()
+        runner.join()
+    finally:
+        # 先提交结果库（最后一批随之交给 CSV），再关闭写入线程
+        store.flush()
+        if sink is not None:
+            sink.close()
+        config_manager.flush()
+
+    print(stats.line())
+    if engine.resumed_pages:
+        print(f"从断点续跑：跳过上次已完成的 {engine.resumed_pages} 页")
+    if store.duplicates:
+        print(f"去重：跳过重复 POI {store.duplicates} 条")
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
+    for keyword, name, code in engine.saturated:
+        print(f"警告：{name}({code})「{keyword}」结果达到接口上限 {CrawlEngine.RESULT_CEILING} 条，可能不完整")
+    for keyword, name, code, page, attempts, error in engine.failed_tasks:
+        print(f"失败：{name}({code})「{keyword}」第 {page} 页，已尝试 {attempts} 次：{error}")
+    if sink is not None:
+        print(f"已写入 {sink.rows_written} 行到 {sink.path}")
+    store.close()
+    tasks.close()
+    return 0 if stats.jobs_done == len(jobs) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m mapsearch", description="高德地图 POI 批量检索（命令行）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = subparsers.add_parser("crawl", help="按关键词与区域检索 POI")
+    crawl_parser.add_argument("-k", "--key", action="append",
+                              help="高德 Web 服务 Key，可重复或用逗号/空格分隔；缺省使用配置中保存的 Key")
+    crawl_parser.add_argument("-q", "--keyword", action="append", required=True,
+                              help="检索关键词，可重复或用逗号分隔")
+    crawl_parser.add_argument("-r", "--region", action="append",
+                              help="区域：all、省份名称、城市/区县名称或 adcode，可重复；缺省为 all")
+    crawl_parser.add_argument("--level", choices=("city", "district"),
+                              help="检索粒度：city 按城市，district 细分到区县；缺省取配置")
+    crawl_parser.add_argument("-o", "--output", help="CSV 输出路径（追加写入）；缺省只写入结果库")
+    crawl_parser.add_argument("--fields", help="导出字段，逗号分隔的中文列名或接口字段名；缺省取配置中勾选的字段")
+    crawl_parser.add_argument("--config", default="config.json", help="配置文件路径（默认 config.json）")
+    crawl_parser.add_argument("--db", help="结果库路径；缺省取配置 result_db")
+    crawl_parser.add_argument("--engine", choices=("thread", "asyncio"),
+                              help="检索引擎：thread 线程池，asyncio 单事件循环（需要 aiohttp）；缺省取配置 crawl_engine")
+    crawl_parser.add_argument("--workers", type=int, help="线程引擎的并发工作线程数；缺省取配置 crawl_workers")
+    crawl_parser.add_argument("--concurrency", type=int, help="asyncio 引擎的并发请求数；缺省取配置 async_concurrency")
+    crawl_parser.add_argument("--qps", type=float, help="每个 Key 每秒请求数；缺省取配置 key_qps")
+    crawl_parser.add_argument("--dedup", choices=("run", "history", "off"), help="去重范围；缺省取配置 dedup_scope")
+    crawl_parser.add_argument("--skip-queried", action="store_true", help="跳过该关键词下已查询过的区域")
+    crawl_parser.add_argument("--no-cache", action="store_true", help="不使用接口响应缓存")
+    crawl_parser.add_argument("--stats-interval", type=float, default=5.0, help="吞吐统计输出间隔（秒，默认 5）")
+    crawl_parser.add_argument("--quiet", action="store_true", help="不输出配置加载与逐个区域的检索日志")
+    crawl_parser.set_defaults(func=crawl)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,121 @@
+# MapSearch 库接口：在自己的程序中以生成器方式流式消费检索结果，无需经过 CSV 文件。
+#
+#   from mapsearch import MapSearchClient
+#
+#   client = MapSearchClient(["KEY1", "KEY2"], qps_per_key=3)
+#   for poi in client.iter_pois("咖啡", ["110000", "440100"]):
+#       handle(poi)
+
+import queue
+import threading
+
+from .core import ApiKeyPool, PoiStore, create_crawl_engine
+
+
+class MapSearchClient:
+    """检索客户端：内置 Key 池与按 Key 限速，iter_pois 在页到达时逐条产出 POI。
+
+    同一个客户端的多次调用共用 Key 池（用量与限速连续计算）；如需跨进程续跑，可传入持久化的 TaskQueue。
+    engine='asyncio' 时使用单事件循环的异步引擎（需要 aiohttp），concurrency 为同时在途的请求数。
+    客户端不向标准输出打印：检索日志（区域状态、key 停用与用尽等）只交给 on_log(text)，未提供时丢弃。
+    """
+
+    _DONE = object()
+
+    def __init__(self, api_keys, qps_per_key=3.0, daily_quota=0, workers=4,
+                 cache=None, task_queue=None, max_buffered_pages=32, on_log=None,
+                 engine='thread', concurrency=64):
+        self.key_pool = ApiKeyPool(list(api_keys), qps_per_key=qps_per_key, daily_quota=daily_quota)
+        self.workers = workers
+        self.engine = engine
+        self.concurrency = concurrency
+        self.cache = cache  # 可选的 ResponseCache
+        self.task_queue = task_queue  # 可选的 TaskQueue，缺省每次调用使用内存队列
+        self.max_buffered_pages = max(1, int(max_buffered_pages or 1))
+        self.on_log = on_log
+        # 最近一次 iter_pois 的结果概要
+        self.saturated = []
+        self.failed_tasks = []
+        self.completed = []
+
+    def iter_pois(self, keywords, adcodes, cancel=None, dedup=True):
+        """按关键词与区域检索，页到达时逐条产出 POI（dict，附带 "keyword" 键）。
+
+        keywords 为单个关键词或关键词列表；adcodes 为 adcode 或 (名称, adcode) 的可迭代对象。
+        cancel 为可选的 threading.Event，置位后尽快停止；提前结束迭代（break / close）同样会停止后台抓取。
+        消费跟不上时后台最多缓冲 max_buffered_pages 页，随后暂停抓取（背压）。
+        dedup=True 时本次调用内按 (POI id, 关键词) 去重：多个关键词命中同一 POI 时每个关键词各产出一条，与结果库一致。
+        """
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        regions = []
+        for item in adcodes:
+            name, code = item if isinstance(item, (tuple, list)) else (item, item)
+            regions.append((str(name), str(code)))
+        jobs = [(keyword, name, code) for keyword in keywords for name, code in regions]
+
+        pages = queue.Queue(maxsize=self.max_buffered_pages)
+        stop = threading.Event()
+        completed = []
+
+        def _running():
+            return not stop.is_set() and not (cancel is not None and cancel.is_set())
+
+        def _put(item, done):
+            # 带超时地放入，消费方停止后不会永久阻塞在满队列上；交给消费方后才视为该页已完成
+            while _running():
+                try:
+                    pages.put(item, timeout=0.2)
+                    done()
+                    return
+                except queue.Full:
+                    continue
+
+        engine = create_crawl_engine(
+            self.engine,
+            self.key_pool,
+            concurrency=self.concurrency,
+            workers=self.workers,
+            on_log=self.on_log,
+            on_pois=lambda keyword, region, region_code, pois, cursor, done: _put((keyword, pois), done),
+            on_city_done=lambda keyword, region, region_code, count: completed.append((keyword, region_code, count)),
+            is_running=_running,
+            cache=self.cache,
+            task_queue=self.task_queue,
+        )
+
+        def _run():
+            try:
+                engine.run(jobs)
+            finally:
+                # 结束标记必须送达，即使已被取消
+                pages.put(self._DONE)
+
+        runner = threading.Thread(target=_run, daemon=True)
+        runner.start()
+        seen = set()
+        try:
+            while True:
+                item = pages.get()
+                if item is self._DONE:
+                    break
+                keyword, pois = item
+                for poi in pois:
+                    if dedup:
+                        key = (PoiStore.poi_key(poi), keyword)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                    yield dict(poi, keyword=keyword)
+        finally:
+            stop.set()
+            # 取出缓冲中的页，让阻塞在 put 上的后台线程尽快退出
+            while runner.is_alive():
+                try:
+                    pages.get(timeout=0.2)
+                except queue.Empty:
+                    pass
+            runner.join()
+            self.saturated = engine.saturated
+            self.failed_tasks = engine.failed_tasks
+            self.completed = completed
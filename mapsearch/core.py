@@ -0,0 +1,1949 @@
+# MapSearch 核心模块：不依赖 Tkinter 的检索、限速、配置与结果存储组件。
+#
+# 图形界面（main.py）与命令行入口（python -m mapsearch）共用这些组件，
+# 可在没有图形环境的服务器或 cron 中运行。
+
+import atexit
+import contextvars
+import functools
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# requests 与 csv 在首次使用时才导入（requests 约占冷启动导入耗时的大半），见 CrawlEngine._session、CsvSink._run
+
+
+def resource_path(relative_path: str) -> str:
+    """随程序分发的资源文件路径，兼容 PyInstaller 单文件（sys._MEIPASS）。"""
+    # 源码运行时资源位于项目根目录（本包的上一级）
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(base_path, relative_path)
+
+
+# 最近一次请求失败的原因（按线程 / asyncio 任务隔离），随失败的页写入任务队列
+_LAST_ERROR = contextvars.ContextVar('mapsearch_last_error', default=None)
+
+# 可导出的 POI 字段：(中文列名, 接口字段名)，界面勾选项与命令行 --fields 均按此顺序
+POI_FIELDS = [
+    ("ID", "id"),
+    ("名称", "name"),
+    ("类型", "type"),
+    ("类型编码", "typecode"),
+    ("地址", "address"),
+    ("经纬度", "location"),
+    ("电话", "tel"),
+    ("网址", "website"),
+    ("邮箱", "email"),
+    ("省份", "pname"),
+    ("城市", "cityname"),
+    ("区域", "adname"),
+    ("入口经纬度", "entr_location"),
+    ("出口经纬度", "exit_location"),
+]
+
+
+class ConfigManager:
+    """统一配置文件管理类"""
+
+    # 查询进度日志超过该条数后，在启动或 flush 时合并回 config.json 并清空
+    JOURNAL_COMPACT_THRESHOLD = 1000
+    # 内置的省/市/区县 adcode 数据（带版本号），config.json 中没有省份数据时使用
+    BUNDLED_REGIONS_FILE = 'regions.json'
+    
+    def __init__(self, config_file='config.json', on_log=print):
+        self.config_file = config_file
+        # 加载、回放与保存等提示的输出方式，传入 None 时不输出
+        self.on_log = on_log
+        self.config = self._load_default_config()
+        # 查询进度以追加日志（JSONL）记录，config.json 作为快照；启动时回放日志覆盖快照
+        self.journal_file = os.path.splitext(config_file)[0] + '.journal.jsonl'
+        self._journal = None
+        self._journal_entries = 0
+        # 检索线程与界面线程共用同一份配置，读写均需持锁
+        self._lock = threading.RLock()
+        atexit.register(self.flush)
+        # 城市索引：城市名 -> adcode、adcode -> 省份名、adcode -> 城市记录（检索热路径 O(1) 查找）
+        self._city_code_by_name = {}
+        self._province_by_code = {}
+        self._city_by_code = {}
+        self.load_config()
+    
+    def _load_default_config(self):
+        """返回默认配置结构"""
+        return {
+            "metadata": {
+                "version": "1.0",
+                "created_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "last_updated": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "total_provinces": 0,
+                "total_cities": 0,
+                "total_districts": 0,
+                "description": "MapSearch配置文件"
+            },
+            "user_settings": {
+                "api_keys": "",
+                "keywords": "",
+                "all_provinces": False,
+                "realtime_export": True,
+                "realtime_export_path": "商家信息.csv",
+                "auto_collect": False,
+                "auto_collect_times": "6:00 18:00 24:00",
+                "crawl_workers": 4,
+                "key_qps": 3.0,
+                "key_daily_quota": 0,
+                "realtime_export_flush_interval": 1.0,
+                "log_max_lines": 500,
+                "results_max_rows": 10000,
+                "log_file": "query_log.txt",
+                "result_db": "results.db",
+                "dedup_scope": "run",
+                "response_cache_db": "response_cache.db",
+                "response_cache_ttl_hours": 24,
+                "response_cache_max_entries": 50000,
+                "task_queue_db": "task_queue.db",
+                "task_max_attempts": 5,
+                "crawl_engine": "thread",
+                "async_concurrency": 64,
+                "region_level": "city"
+            },
+            "field_settings": {
+                "ID": False,
+                "名称": True,
+                "类型": False,
+                "电话": True,
+                "网址": False,
+                "邮箱": False,
+                "省份": True,
+                "城市": True,
+                "区域": True,
+                "地址": True,
+                "类型编码": False,
+                "经纬度": False,
+                "入口经纬度": False,
+                "出口经纬度": False
+            },
+            "provinces": {},
+            # 按关键词记录的查询进度：{关键词: {adcode: {"last_query_time": ..., "query_count": ...}}}
+            "keyword_progress": {}
+        }
+    
+    def load_config(self):
+        """从JSON文件加载配置快照并回放查询进度日志，如果文件不存在则使用默认配置"""
+        with self._lock:
+            try:
+                if os.path.exists(self.config_file):
+                    with open(self.config_file, 'r', encoding='utf-8') as f:
+                        loaded_config = json.load(f)
+                        # 合并配置，确保新字段不丢失
+                        self._merge_config(loaded_config)
+                    self._log(f"已加载配置文件: {self.config_file}")
+                else:
+                    self._log(f"配置文件不存在，使用默认配置: {self.config_file}")
+            except Exception as e:
+                self._log(f"加载配置文件失败: {e}，使用默认配置")
+            if not self.config.get("provinces"):
+                # 首次启动：直接使用内置行政区划数据，无需 Key、不消耗配额
+                self.load_bundled_regions()
+            # 先建索引，回放时按 adcode 定位城市/区县记录
+            self._rebuild_city_index()
+            self._replay_journal()
+            self._rebuild_city_index()
+            if self._journal_entries >= self.JOURNAL_COMPACT_THRESHOLD:
+                self.compact_journal()
+    
+    def load_bundled_regions(self):
+        """将内置的省/市/区县数据写入配置（不落盘），返回是否成功。"""
+        path = resource_path(self.BUNDLED_REGIONS_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                bundled = json.load(f)
+        except (OSError, ValueError) as e:
+            self._log(f"加载内置行政区划数据失败: {e}")
+            return False
+        province_to_cities = {}
+        city_name_to_adcode = {}
+        city_to_districts = {}
+        for province_name, _, cities in bundled.get("provinces", []):
+            province_to_cities[province_name] = [(city_name, city_code) for city_name, city_code, _ in cities]
+            for city_name, city_code, districts in cities:
+                city_name_to_adcode[city_name] = city_code
+                if districts:
+                    city_to_districts[city_code] = [tuple(pair) for pair in districts]
+        self.update_provinces_data(province_to_cities, city_name_to_adcode, city_to_districts,
+                                   version=f"bundled-{bundled.get('version', '')}")
+        self._log(f"已加载内置行政区划数据（版本 {bundled.get('version', '')}）")
+        return True
+
+    def _log(self, text):
+        if self.on_log is not None:
+            self.on_log(text)
+
+    def _merge_config(self, loaded_config):
+        """合并加载的配置和默认配置"""
+        for section, values in loaded_config.items():
+            if section in self.config:
+                if isinstance(values, dict):
+                    self.config[section].update(values)
+                else:
+                    self.config[section] = values
+    
+    def save_config(self):
+        """保存当前配置到JSON文件（先写临时文件再原子替换，中途崩溃不会留下半个文件）"""
+        with self._lock:
+            tmp_file = f"{self.config_file}.tmp"
+            try:
+                self.config["metadata"]["last_updated"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.config, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.config_file)
+                # 快照已包含全部查询进度，日志可以清空
+                self._truncate_journal()
+                self._log(f"配置已保存到: {self.config_file}")
+                return True
+            except Exception as e:
+                self._log(f"保存配置失败: {e}")
+                return False
+    
+    def get_user_settings(self):
+        """获取用户设置"""
+        return self.config.get("user_settings", {})
+    
+    def update_user_settings(self, settings):
+        """更新用户设置"""
+        self.config["user_settings"].update(settings)
+    
+    def get_field_settings(self):
+        """获取字段设置"""
+        return self.config.get("field_settings", {})
+    # 
+    def update_field_settings(self, fields):
+        """更新字段设置"""
+        self.config["field_settings"].update(fields)
+    
+    def get_provinces(self):
+        """获取省份数据"""
+        return self.config.get("provinces", {})
+    
+    def get_cities_by_province(self, province_name):
+        """获取指定省份下的所有城市"""
+        provinces = self.config.get("provinces", {})
+        if province_name in provinces:
+            return provinces[province_name].get("cities", {})
+        return {}
+    
+    def get_all_cities(self):
+        """获取所有城市数据（平铺结构）：返回 {city_name: city_code}。"""
+        all_cities = {}
+        provinces = self.config.get("provinces", {})
+        for province_name, province in provinces.items():
+            cities = province.get("cities", {})
+            for city_name, city_data in cities.items():
+                city_code = city_data.get("adcode")
+                if city_name and city_code:
+                    all_cities[city_name] = city_code
+        return all_cities
+
+    def iter_cities(self, province_name):
+        """遍历指定省份下的城市，统一返回 (city_code, city_name)。
+        根据当前配置文件结构：cities = { city_name: { adcode: city_code, ... } }
+        """
+        provinces = self.config.get("provinces", {})
+        province = provinces.get(province_name, {})
+        cities = province.get("cities", {})
+        for city_name, city_data in cities.items():
+            city_code = city_data.get("adcode")
+            if city_name and city_code:
+                yield city_code, city_name
+
+    @staticmethod
+    def district_label(city_name, district_name):
+        """区县在选择列表与检索中使用的名称（区县重名较多，带上所属城市）。"""
+        return f"{city_name}·{district_name}"
+
+    def iter_regions(self, province_name, level='city'):
+        """遍历指定省份下可检索的区域，统一返回 (adcode, 名称)。
+
+        level='city' 时与 iter_cities 相同；level='district' 时返回各城市下的区县，
+        没有区县数据的城市（如不设区的地级市）仍以城市本身出现。
+        """
+        if level != 'district':
+            yield from self.iter_cities(province_name)
+            return
+        province = self.config.get("provinces", {}).get(province_name, {})
+        for city_name, city_data in province.get("cities", {}).items():
+            districts = city_data.get("districts") or {}
+            if not districts:
+                if city_name and city_data.get("adcode"):
+                    yield city_data.get("adcode"), city_name
+                continue
+            for district_name, district_data in districts.items():
+                district_code = district_data.get("adcode")
+                if district_name and district_code:
+                    yield district_code, self.district_label(city_name, district_name)
+
+    def iter_region_records(self, level='city'):
+        """遍历全部省份下可检索区域的记录，返回 (省份名, 名称, 记录)。"""
+        for province_name in list(self.config.get("provinces", {}).keys()):
+            for region_code, region_name in self.iter_regions(province_name, level):
+                yield province_name, region_name, self._city_by_code.get(region_code, {})
+
+    def resolve_regions(self, selectors, level='city'):
+        """将区域选择器解析为 [(名称, adcode), ...]（去重并保持顺序），供命令行与库调用使用。
+
+        选择器可以是 "all"、省份名称或省级 adcode（该省全部区域）、城市名称或 adcode、
+        区县名称（"城市·区县"）或 adcode；level='district' 时城市选择器展开为其下区县。
+        无法识别的选择器抛出 ValueError。
+        """
+        provinces = self.config.get("provinces", {})
+        province_by_code = {data.get("adcode"): name for name, data in provinces.items() if data.get("adcode")}
+        resolved = {}
+        for selector in selectors:
+            selector = str(selector).strip()
+            if selector.lower() == "all":
+                for _, region_name, record in self.iter_region_records(level):
+                    resolved.setdefault(record.get("adcode"), region_name)
+                continue
+            province_name = selector if selector in provinces else province_by_code.get(selector)
+            if province_name:
+                for region_code, region_name in self.iter_regions(province_name, level):
+                    resolved.setdefault(region_code, region_name)
+                continue
+            region_code = self.get_city_code(selector) or (selector if selector in self._city_by_code else None)
+            if not region_code:
+                raise ValueError(f"无法识别的区域：{selector}")
+            record = self._city_by_code.get(region_code, {})
+            districts = record.get("districts") or {}
+            if level == 'district' and districts:
+                for district_name, district_data in districts.items():
+                    resolved.setdefault(district_data.get("adcode"),
+                                        self.district_label(record.get("name", ""), district_name))
+                continue
+            resolved.setdefault(region_code, selector if selector != region_code else record.get("name", region_code))
+        return [(name, code) for code, name in resolved.items() if code]
+
+    def has_districts(self):
+        """配置中是否已包含区县级数据。"""
+        return any(city_data.get("districts")
+                   for province in self.config.get("provinces", {}).values()
+                   for city_data in province.get("cities", {}).values())
+    
+    def update_provinces_data(self, province_to_cities, city_name_to_adcode, city_to_districts=None, version=None):
+        """更新省市数据到配置中，存储为：
+        provinces = {
+            province_name: {
+                "name": province_name,
+                "adcode": province_adcode,
+                "cities": { city_name: { "name": city_name, "adcode": city_adcode, ...,
+                                         "districts": { district_name: { "name", "adcode", ... } } } }
+            }
+        }
+        兼容传入的 city_pairs 为 (city_name, city_code) 或 (city_code, city_name)；
+        city_to_districts 为可选的 {city_adcode: [(区县名, adcode), ...]}，提供时写入第三级。
+        按 adcode 增量更新：已存在的城市/区县保留查询状态，返回 (新增数, 移除数)；
+        version 为数据来源版本（如 bundled-1、remote-20250101），记入 metadata.regions_version。
+        """
+        # 整个替换过程持锁：检索线程的 update_city_query_status / is_queried 不会读到半更新的索引，
+        # 也不会有查询状态在快照之后写入旧记录而丢失
+        with self._lock:
+            city_to_districts = city_to_districts or {}
+            previous = dict(self._city_by_code)
+            kept = set()
+
+            def _carry_status(record):
+                old = previous.get(record["adcode"])
+                if old is not None:
+                    kept.add(record["adcode"])
+                    for field in ("queried", "last_query_time", "query_count"):
+                        record[field] = old.get(field, record[field])
+                return record
+
+            # 清空现有的省份数据
+            self.config["provinces"] = {}
+
+            for province_name, city_pairs in province_to_cities.items():
+                # 推导省级 adcode（城市前两位 + 0000）
+                province_adcode = ""
+                if city_pairs:
+                    first_a, first_b = city_pairs[0]
+                    # 判断哪一个是 code
+                    candidate = first_a if (isinstance(first_a, str) and first_a.isdigit()) else first_b
+                    if isinstance(candidate, str) and len(candidate) >= 2 and candidate.isdigit():
+                        province_adcode = candidate[:2] + "0000"
+
+                self.config["provinces"][province_name] = {
+                    "name": province_name,
+                    "adcode": province_adcode,
+                    "cities": {}
+                }
+
+                for a, b in city_pairs:
+                    if isinstance(a, str) and a.isdigit():
+                        city_code, city_name = a, b
+                    else:
+                        city_name, city_code = a, b
+                    city_record = {
+                        "name": city_name,
+                        "adcode": city_code,
+                        "queried": False,
+                        "last_query_time": None,
+                        "query_count": 0
+                    }
+                    districts = city_to_districts.get(city_code)
+                    if districts:
+                        city_record["districts"] = {
+                            district_name: _carry_status({
+                                "name": district_name,
+                                "adcode": district_code,
+                                "queried": False,
+                                "last_query_time": None,
+                                "query_count": 0
+                            })
+                            for district_name, district_code in districts
+                        }
+                    self.config["provinces"][province_name]["cities"][city_name] = _carry_status(city_record)
+
+            # 更新统计信息
+            self._update_metadata_counts()
+            if version:
+                self.config["metadata"]["regions_version"] = version
+            self._rebuild_city_index()
+            added = len(set(self._city_by_code) - kept)
+            removed = len(set(previous) - kept)
+            return added, removed
+    
+    def update_city_query_status(self, province_name, city_code, city_name, queried=True, keyword=None):
+        """更新城市查询状态（仅追加一条进度日志，不重写 config.json）。
+
+        给出 keyword 时同时记录该关键词下的进度；城市记录上的 queried 仅表示“被任一关键词查询过”。
+        """
+        with self._lock:
+            city_data = self._apply_city_status(province_name, city_name, {"adcode": city_code})
+            if queried:
+                city_data["queried"] = True
+                city_data["last_query_time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                city_data["query_count"] = city_data.get("query_count", 0) + 1
+            else:
+                city_data["queried"] = False
+            keyword_status = self._apply_keyword_status(keyword, city_code, queried) if keyword else None
+            # 记录变更后的绝对值，回放时可重复应用
+            self._append_journal({
+                "op": "status",
+                "province": province_name,
+                "name": city_name,
+                "adcode": city_data.get("adcode", city_code),
+                "queried": city_data["queried"],
+                "last_query_time": city_data.get("last_query_time"),
+                "query_count": city_data.get("query_count", 0),
+                "keyword": keyword,
+                "keyword_status": keyword_status,
+            })
+
+    def _apply_keyword_status(self, keyword, city_code, queried, values=None):
+        """更新 (关键词, adcode) 的进度，返回写入后的记录（未查询时返回 None，调用方持有锁）。
+
+        values 为回放日志时的绝对值；缺省时按本次查询累加。
+        """
+        progress = self.config.setdefault("keyword_progress", {}).setdefault(keyword, {})
+        if not queried:
+            progress.pop(city_code, None)
+            return None
+        if values is None:
+            previous = progress.get(city_code, {})
+            values = {
+                "last_query_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "query_count": previous.get("query_count", 0) + 1,
+            }
+        progress[city_code] = dict(values)
+        return progress[city_code]
+
+    def is_queried(self, city_code, keyword=None):
+        """区域是否已查询：给出 keyword 时只看该关键词下的进度。"""
+        with self._lock:
+            if keyword:
+                return city_code in self.config.get("keyword_progress", {}).get(keyword, {})
+            return bool((self._city_by_code.get(city_code) or {}).get("queried"))
+
+    def _apply_city_status(self, province_name, city_name, values):
+        """将状态字段写入指定城市或区县记录（不存在则创建城市记录），返回该记录（调用方持有锁）。"""
+        # 已知 adcode 的记录（含区县）直接按索引定位
+        record = self._city_by_code.get(values.get("adcode"))
+        if record is not None:
+            for field in ("queried", "last_query_time", "query_count"):
+                if field in values:
+                    record[field] = values[field]
+            return record
+
+        if "provinces" not in self.config:
+            self.config["provinces"] = {}
+        
+        if province_name not in self.config["provinces"]:
+            self.config["provinces"][province_name] = {"adcode": "", "cities": {}}
+        
+        if "cities" not in self.config["provinces"][province_name]:
+            self.config["provinces"][province_name]["cities"] = {}
+        
+        # 以城市名为键进行存储，保持 adcode 字段
+        cities = self.config["provinces"][province_name]["cities"]
+        city_data = cities.get(city_name, {
+            "name": city_name,
+            "adcode": values.get("adcode"),
+            "queried": False,
+            "last_query_time": None,
+            "query_count": 0
+        })
+        for field in ("queried", "last_query_time", "query_count"):
+            if field in values:
+                city_data[field] = values[field]
+        cities[city_name] = city_data
+        self._index_city(province_name, city_name, city_data)
+        return city_data
+
+    def _open_journal(self):
+        """以追加方式打开进度日志；若上次写入被中断留下半行，先补一个换行隔开（调用方持有锁）。"""
+        if self._journal is None:
+            needs_newline = False
+            if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > 0:
+                with open(self.journal_file, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b'\n'
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+            if needs_newline:
+                self._journal.write('\n')
+        return self._journal
+
+    def _append_journal(self, entry):
+        """追加一条进度记录（调用方持有锁）。写入失败时退回到整份保存。"""
+        try:
+            journal = self._open_journal()
+            journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            journal.flush()
+            self._journal_entries += 1
+        except Exception as e:
+            self._log(f"写入查询进度日志失败: {e}，改为保存完整配置")
+            self.save_config()
+
+    def _replay_journal(self):
+        """将进度日志回放到已加载的快照上（调用方持有锁）。被中断写入的残缺行直接跳过。"""
+        self._journal_entries = 0
+        if not os.path.exists(self.journal_file):
+            return
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("op") == "status":
+                        self._apply_city_status(entry.get("province", ""), entry.get("name"), entry)
+                        if entry.get("keyword"):
+                            self._apply_keyword_status(entry["keyword"], entry.get("adcode"),
+                                                       entry.get("keyword_status") is not None,
+                                                       entry.get("keyword_status"))
+                    elif entry.get("op") == "reset":
+                        self._reset_all_query_status(entry.get("keyword"))
+                    self._journal_entries += 1
+            if self._journal_entries:
+                self._log(f"已回放查询进度日志 {self._journal_entries} 条: {self.journal_file}")
+        except Exception as e:
+            self._log(f"回放查询进度日志失败: {e}")
+
+    def _truncate_journal(self):
+        """清空进度日志（快照已包含其全部内容时调用，调用方持有锁）。"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_file):
+            open(self.journal_file, 'w', encoding='utf-8').close()
+        self._journal_entries = 0
+
+    def compact_journal(self):
+        """压缩进度日志：将当前状态写成新快照后清空日志。"""
+        with self._lock:
+            return self.save_config()
+
+    def flush(self):
+        """将进度日志同步到磁盘，日志过长时顺带压缩（停止查询、查询结束与退出程序时调用）。"""
+        with self._lock:
+            if self._journal_entries >= self.JOURNAL_COMPACT_THRESHOLD:
+                return self.compact_journal()
+            if self._journal is not None:
+                try:
+                    self._journal.flush()
+                    os.fsync(self._journal.fileno())
+                except Exception as e:
+                    self._log(f"同步查询进度日志失败: {e}")
+                    return False
+            return True
+    
+    def get_queried_cities(self):
+        """获取已查询城市列表（含已查询的区县，以区县检索名称表示）"""
+        queried_cities = []
+        provinces = self.config.get("provinces", {})
+        for province_name, province_data in provinces.items():
+            cities = province_data.get("cities", {})
+            for city_name, city_data in cities.items():
+                if city_data.get("queried", False):
+                    queried_cities.append(city_name)
+                for district_name, district_data in (city_data.get("districts") or {}).items():
+                    if district_data.get("queried", False):
+                        queried_cities.append(self.district_label(city_name, district_name))
+        return queried_cities
+    
+    def reset_all_query_status(self, keyword=None):
+        """重置查询状态：给出 keyword 时只清除该关键词的进度，否则重置所有城市与所有关键词"""
+        with self._lock:
+            self._reset_all_query_status(keyword)
+            self._append_journal({"op": "reset", "keyword": keyword})
+
+    def _reset_all_query_status(self, keyword=None):
+        if keyword:
+            self.config.get("keyword_progress", {}).pop(keyword, None)
+            return
+        self.config["keyword_progress"] = {}
+        provinces = self.config.get("provinces", {})
+        for province_name, province_data in provinces.items():
+            cities = province_data.get("cities", {})
+            for city_name, city_data in cities.items():
+                for record in [city_data, *(city_data.get("districts") or {}).values()]:
+                    record["queried"] = False
+                    record["last_query_time"] = None
+                    record["query_count"] = 0
+    
+    def find_province_by_city_code(self, city_code):
+        """根据城市代码找到所属省份名（索引查找）。未找到返回空字符串。"""
+        with self._lock:
+            return self._province_by_code.get(city_code, "")
+
+    def get_city_code(self, city_name):
+        """根据城市名返回 adcode（索引查找）；未找到返回 None。"""
+        with self._lock:
+            return self._city_code_by_name.get(city_name)
+
+    def get_city_record(self, city_code):
+        """根据 adcode 返回配置中的城市记录（与配置共享同一个 dict）；未找到返回 None。"""
+        with self._lock:
+            return self._city_by_code.get(city_code)
+
+    def find_city(self, city_name):
+        """根据城市名返回 (省份名, adcode)；未找到返回 ("", None)。"""
+        with self._lock:
+            city_code = self._city_code_by_name.get(city_name)
+            if not city_code:
+                return "", None
+            return self._province_by_code.get(city_code, ""), city_code
+
+    def _index_city(self, province_name, city_name, city_data):
+        """将单个城市（及其区县）写入索引；同名城市以先出现者为准，与原先顺序遍历的结果一致。"""
+        if not isinstance(city_data, dict):
+            return
+        city_code = city_data.get("adcode")
+        if not city_code:
+            return
+        if city_name:
+            self._city_code_by_name.setdefault(city_name, city_code)
+        self._province_by_code[city_code] = province_name
+        self._city_by_code[city_code] = city_data
+        for district_name, district_data in (city_data.get("districts") or {}).items():
+            district_code = district_data.get("adcode") if isinstance(district_data, dict) else None
+            if not district_code:
+                continue
+            self._city_code_by_name.setdefault(self.district_label(city_name, district_name), district_code)
+            self._province_by_code[district_code] = province_name
+            self._city_by_code[district_code] = district_data
+
+    def _rebuild_city_index(self):
+        """根据当前省份树重建全部城市索引（加载配置或替换省市数据后调用）。"""
+        self._city_code_by_name = {}
+        self._province_by_code = {}
+        self._city_by_code = {}
+        for province_name, province_data in self.config.get("provinces", {}).items():
+            for city_name, city_data in province_data.get("cities", {}).items():
+                self._index_city(province_name, city_name, city_data)
+    
+    def _update_metadata_counts(self):
+        """更新元数据中的统计信息"""
+        provinces = self.config.get("provinces", {})
+        total_provinces = len(provinces)
+        total_cities = sum(len(p.get("cities", {})) for p in provinces.values())
+        total_districts = sum(len(c.get("districts") or {}) for p in provinces.values()
+                              for c in p.get("cities", {}).values())
+        
+        self.config["metadata"]["total_provinces"] = total_provinces
+        self.config["metadata"]["total_cities"] = total_cities
+        self.config["metadata"]["total_districts"] = total_districts
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多积攒 capacity 个（调用方负责加锁）。"""
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = float(rate) if rate and rate > 0 else 0.0
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate <= 0:
+            self.tokens = self.capacity
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, now=None):
+        """尝试取一个令牌：成功返回 0，否则返回还需等待的秒数。"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def drain(self, now=None):
+        """清空令牌（服务端报告限流时使用）。"""
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens = 0.0
+
+
+class ApiKeyPool:
+    """多 key 池：每个 key 拥有独立的 QPS 令牌桶与每日额度，请求分配给当前有余量的 key。
+
+    与逐个用尽再切换不同，N 个 key 会被同时使用，吞吐约为单 key 的 N 倍（线程安全）。
+    """
+
+    # 当日额度耗尽：次日自动恢复
+    DAILY_LIMIT_INFOS = ("USER_DAILY_QUERY_OVER_LIMIT", "DAILY_QUERY_OVER_LIMIT")
+    # key 本身不可用：本次运行内不再使用
+    INVALID_KEY_INFOS = ("INVALID_USER_KEY", "USERKEY_PLAT_NOMATCH", "INVALID_USER_SCODE",
+                         "INVALID_USER_IP", "INSUFFICIENT_PRIVILEGES", "USER_KEY_RECYCLED")
+    # 并发超限：仅短暂冷却该 key
+    QPS_LIMIT_INFOS = ("CUQPS_HAS_EXCEEDED_THE_LIMIT", "CKQPS_HAS_EXCEEDED_THE_LIMIT",
+                       "ACCESS_TOO_FREQUENT", "EXCEEDED_THE_LIMIT")
+
+    def __init__(self, api_keys, qps_per_key=3.0, daily_quota=0):
+        """daily_quota 为每个 key 每日请求上限，0 表示不限（以服务端返回为准）。"""
+        self.daily_quota = int(daily_quota or 0)
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._keys = []
+        for key in dict.fromkeys(k for k in api_keys if k):
+            self._keys.append({
+                "key": key,
+                "bucket": TokenBucket(qps_per_key, capacity=max(1.0, qps_per_key or 1.0)),
+                "day": datetime.now().date(),
+                "used_today": 0,
+                "disabled": None,         # None | 'daily' | 'invalid'
+                "cooldown_until": 0.0,
+            })
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _available(self, state, today, now):
+        """判断 key 当前是否可用（同时处理跨天的额度重置）。"""
+        if state["day"] != today:
+            state["day"] = today
+            state["used_today"] = 0
+            if state["disabled"] == 'daily':
+                state["disabled"] = None
+        if state["disabled"]:
+            return False
+        if self.daily_quota and state["used_today"] >= self.daily_quota:
+            return False
+        return state["cooldown_until"] <= now
+
+    @property
+    def exhausted(self):
+        """所有 key 均已失效或用尽当日额度。"""
+        with self._lock:
+            today = datetime.now().date()
+            now = time.monotonic()
+            for state in self._keys:
+                self._available(state, today, now)
+                if not state["disabled"] and not (self.daily_quota and state["used_today"] >= self.daily_quota):
+                    return False
+            return True
+
+    def try_acquire(self):
+        """不阻塞地取一个有余量的 key，返回 (key, 0)；暂无余量返回 (None, 需等待秒数)，全部用尽返回 (None, None)。"""
+        wait = None
+        with self._lock:
+            today = datetime.now().date()
+            now = time.monotonic()
+            count = len(self._keys)
+            for offset in range(count):
+                index = (self._cursor + offset) % count
+                state = self._keys[index]
+                if not self._available(state, today, now):
+                    if not state["disabled"] and state["cooldown_until"] > now:
+                        delay = state["cooldown_until"] - now
+                        wait = delay if wait is None else min(wait, delay)
+                    continue
+                delay = state["bucket"].try_take(now)
+                if delay <= 0:
+                    state["used_today"] += 1
+                    # 下次从下一个 key 开始找，使负载均匀分布
+                    self._cursor = (index + 1) % count
+                    return state["key"], 0.0
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def acquire(self, should_continue=None):
+        """阻塞直到某个 key 有余量并返回该 key；全部用尽或 should_continue() 为假时返回 None。"""
+        while True:
+            key, wait = self.try_acquire()
+            if key is not None:
+                return key
+            if wait is None:
+                return None
+            if should_continue is not None and not should_continue():
+                return None
+            time.sleep(min(wait, 0.2))
+
+    def report_error(self, key, info):
+        """根据高德返回的错误信息调整 key 状态，返回是否应换 key 重试该请求（不输出日志，由调用方记录）。"""
+        with self._lock:
+            state = next((s for s in self._keys if s["key"] == key), None)
+            if state is None:
+                return False
+            if info in self.QPS_LIMIT_INFOS:
+                state["bucket"].drain()
+                state["cooldown_until"] = time.monotonic() + 1.0
+                return True
+            if info in self.DAILY_LIMIT_INFOS:
+                state["disabled"] = 'daily'
+            elif info in self.INVALID_KEY_INFOS:
+                state["disabled"] = 'invalid'
+            else:
+                # 与 key 无关的错误（如参数错误），换 key 也无济于事
+                return False
+            return True
+
+    def summary(self):
+        """返回各 key 的当日用量与状态，便于日志展示。"""
+        with self._lock:
+            return [(s["key"], s["used_today"], s["disabled"]) for s in self._keys]
+
+
+class CrawlEngine:
+    """多城市并发检索引擎：工作线程池同时抓取多个 (关键词, 城市) 任务的分页，所有请求经 ApiKeyPool 统一限速与分配 key。
+
+    结果、日志与城市完成事件通过回调回传（均带关键词）；回调在引擎内部串行调用，
+    因此 CSV 导出、配置写入等非线程安全的下游无需额外加锁。
+    """
+
+    PLACE_TEXT_URL = "https://restapi.amap.com/v3/place/text"  # 文本检索接口
+    DISTRICT_URL = "https://restapi.amap.com/v3/config/district"  # 行政区划接口
+    PAGE_SIZE = 20
+    RESULT_CEILING = 1000  # 文本检索 count 的上限，达到即视为结果被截断
+    _RETRY = object()  # 响应处理结果：换 key 后重试同一请求
+
+    def __init__(self, key_pool, workers=4,
+                 on_log=None, on_pois=None, on_city_done=None,
+                 is_running=None, is_paused=None, cache=None, done_pages=None, task_queue=None):
+        self.key_pool = key_pool
+        self.cache = cache  # 可选的 ResponseCache，命中时不消耗 key
+        # 页任务队列：传入持久化的 TaskQueue 时失败与未完成的页在进程重启后仍可继续，缺省使用内存队列
+        self.task_queue = task_queue
+        # 上次中断时已完成的页 {(关键词, adcode, 页码): 总数}，续跑时跳过
+        self.done_pages = done_pages or {}
+        self.resumed_pages = 0
+        self.workers = max(1, int(workers or 1))
+        self.on_log = on_log
+        self.on_pois = on_pois
+        self.on_city_done = on_city_done
+        self.is_running = is_running
+        self.is_paused = is_paused
+
+        self.keys_exhausted = False
+        self.saturated = []  # 无法再细分、结果仍达到上限的区域 [(关键词, 名称, adcode), ...]
+        self.failed_tasks = []  # 多次重试仍失败的页 [(关键词, 名称, adcode, 页码, 尝试次数, 错误), ...]
+        self._subdistricts = {}  # adcode -> [(名称, adcode), ...]，行政区划接口结果缓存
+        # 可重入：下游在 on_pois 中提交结果库时可能随即确认页落盘，进而在同一线程触发 on_city_done
+        self._emit_lock = threading.RLock()
+        self._task_lock = threading.Lock()  # 保护页任务计数与城市状态
+        self._local = threading.local()
+        self.poi_count = 0
+
+    def _should_continue(self):
+        """引擎是否应继续工作：外部未停止且 key 未用尽。"""
+        if self.keys_exhausted:
+            return False
+        return self.is_running() if self.is_running is not None else True
+
+    def _wait_if_paused(self):
+        """暂停时空转等待，直到继续或停止。"""
+        while self.is_paused is not None and self.is_paused() and self._should_continue():
+            time.sleep(0.2)
+
+    def _emit(self, callback, *args):
+        """串行调用回调，避免多个工作线程同时写入下游。"""
+        if callback is None:
+            return
+        with self._emit_lock:
+            try:
+                callback(*args)
+            except Exception as e:
+                # 回调本身（可能就是 on_log）出错：只能写到 stderr，不占用调用方的标准输出
+                print(f"检索回调执行失败: {e}", file=sys.stderr)
+
+    def _log(self, text):
+        self._emit(self.on_log, text)
+
+    def _session(self):
+        """每个工作线程持有独立的 Session（requests.Session 非线程安全）。"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            session = requests.Session()
+            # 基础重试策略：429/5xx 时退避重试
+            retry = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+            adapter = HTTPAdapter(max_retries=retry)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def _acquire_key(self):
+        """从 key 池取一个有余量的 key；若全部用尽则记录日志并让所有工作线程退出。"""
+        api_key = self.key_pool.acquire(self._should_continue)
+        if api_key is None:
+            self._check_exhausted()
+        return api_key
+
+    def _check_exhausted(self):
+        """key 全部用尽时记录日志（只记录一次）并让所有工作者退出。"""
+        if self.key_pool.exhausted:
+            with self._emit_lock:
+                first = not self.keys_exhausted
+                self.keys_exhausted = True
+            if first:
+                self._log("所有 key 都用完，程序结束。\n")
+
+    def run(self, jobs):
+        """并发抓取 jobs（[(关键词, 城市名, adcode), ...]，即关键词 × 区域矩阵），
+        阻塞直到全部完成或被停止，返回抓取到的 POI 条数。
+
+        调度单位是"页"：每个任务先取第 1 页，按返回的 count 规划出确切的页集合，
+        其余页放回任务队列由所有工作线程领取并发抓取（仍经 key 池限速）；已开始任务的后续页优先于新任务。
+        失败的页按指数退避重新排队，超过最大尝试次数后记入 failed_tasks，所属任务本轮不标记为完成。
+        若某区域首页 count 达到接口上限，则按行政区划接口（subdistrict=2）拆分为下级区县分别抓取，
+        下级仍饱和时继续下钻；细分后的结果在任务内按 POI id 去重，无法再细分的饱和区域记入 saturated。
+        POI 本身只经 on_pois 回调交给下游（界面、CSV、结果库），引擎不在内存中累积；
+        on_pois 的最后一个参数 done 须在本页结果落盘后调用，此前该页在任务队列中不会标记为已完成。
+        """
+        self._prepare(jobs)
+        threads = []
+        for _ in range(min(self.workers, max(1, len(jobs)))):
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        return self._finish_run()
+
+    def _prepare(self, jobs):
+        """登记本轮任务：沿用各任务上次未完成的页（含已下钻的区县页），否则从第 1 页开始。"""
+        self._tasks = self.task_queue if self.task_queue is not None else TaskQueue(':memory:')
+        self._run_token = f"{os.getpid()}-{time.time_ns()}"
+        self._cities = {}
+        self._nodes = {}
+        for keyword, region, region_code in jobs:
+            unfinished = self._tasks.open_job(self._run_token, keyword, region_code, region)
+            drilled = any(adcode != region_code for adcode, _, _ in unfinished)
+            self._cities[(keyword, region_code)] = {
+                "region": region, "pending": len(unfinished), "count": 0, "failed": False,
+                "seen": set() if drilled else None,
+            }
+            self._nodes[(keyword, region_code)] = {"name": region, "root": region_code}
+            for adcode, _, name in unfinished:
+                self._nodes.setdefault((keyword, adcode), {"name": name or adcode, "root": region_code})
+
+    def _finish_run(self):
+        self.failed_tasks = self._tasks.failed_tasks(self._run_token)
+        if self.task_queue is None:
+            self._tasks.close()
+        return self.poi_count
+
+    def _put_task(self, priority, keyword, region_code, page_num):
+        node = self._nodes[(keyword, region_code)]
+        return self._tasks.enqueue(self._run_token, keyword, region_code, page_num, node["name"], node["root"], priority)
+
+    def _worker(self):
+        while self._should_continue():
+            # 先等待暂停结束再领取，避免暂停期间租约过期
+            self._wait_if_paused()
+            task = self._tasks.lease(self._run_token)
+            if task is None:
+                # 暂无到期任务：仍在抓取的第 1 页可能派生新任务，退避中的任务到期后再领取
+                remaining, wait = self._tasks.outstanding(self._run_token)
+                if remaining == 0:
+                    return
+                time.sleep(min(max(wait, 0.05), 0.5))
+                continue
+            self._run_page(task)
+
+    def _run_page(self, task):
+        """抓取一页（首页饱和时取下级区域），再交给 _finish_page 更新任务状态。"""
+        keyword, region_code, page_num = task
+        _LAST_ERROR.set(None)
+        name = self._nodes[(keyword, region_code)]["name"]
+        pois, total, children = None, 0, None
+        resumed = (keyword, region_code, page_num) in self.done_pages
+        if self._should_continue():
+            try:
+                if resumed:
+                    pois, total = self._resume_page(task)
+                else:
+                    pois, total = self._fetch_page(keyword, name, region_code, page_num)
+                if page_num == 1 and pois is not None and total >= self.RESULT_CEILING:
+                    children = self._load_subdistricts(name, region_code)
+                    if children is None:
+                        pois = None
+            except Exception as e:
+                self._log(f"{name} 第 {page_num} 页查询失败：{e}\n")
+                _LAST_ERROR.set(str(e))
+                pois = None
+        self._finish_page(task, pois, total, children or [], resumed)
+
+    def _resume_page(self, task):
+        """断点之前已入库并导出的页：不再请求，只用记录的总数继续规划。"""
+        with self._task_lock:
+            self.resumed_pages += 1
+        return [], self.done_pages[task]
+
+    def _finish_page(self, task, pois, total, children, resumed):
+        """根据一页的抓取结果更新所属任务：失败则退避重试，成功则交给下游并派生后续页；
+        任务（含下钻的区县）的所有页都经下游确认落盘后由 _page_done 触发 on_city_done。"""
+        keyword, region_code, page_num = task
+        node = self._nodes[(keyword, region_code)]
+        name = node["name"]
+        city = self._cities[(keyword, node["root"])]
+        if pois is None:
+            if not self._should_continue():
+                # 被停止或 key 用尽：放回队列，下次检索时继续
+                self._tasks.release(task)
+                with self._task_lock:
+                    city["failed"] = True
+                return
+            delay = self._tasks.fail(task, _LAST_ERROR.get())
+            if delay is not None:
+                self._log(f"{name}「{keyword}」第 {page_num} 页失败，{delay:.0f} 秒后重试\n")
+                return
+            self._log(f"{name}「{keyword}」第 {page_num} 页多次重试仍失败，已保留在任务队列中\n")
+
+        extra_pages = []
+        with self._task_lock:
+            if pois is None:
+                city["failed"] = True
+            else:
+                if page_num == 1 and children:
+                    # 结果被截断：改为抓取各下级区县，本区域不再继续翻页
+                    for child_name, child_code in children:
+                        self._nodes.setdefault((keyword, child_code), {"name": child_name, "root": node["root"]})
+                    city["pending"] += len(children)
+                    if city["seen"] is None:
+                        city["seen"] = set()
+                elif page_num == 1:
+                    if total >= self.RESULT_CEILING:
+                        self.saturated.append((keyword, name, region_code))
+                    # 按首页 count 规划确切页数，不再多发一次空的尾页请求
+                    total_pages = -(-min(total, self.RESULT_CEILING) // self.PAGE_SIZE)
+                    extra_pages = list(range(2, total_pages + 1))
+                    city["pending"] += len(extra_pages)
+                if city["seen"] is not None:
+                    # 下钻后上下级结果存在重叠，在任务内按 id 去重
+                    fresh = []
+                    for poi in pois:
+                        poi_id = poi.get("id")
+                        if poi_id and poi_id in city["seen"]:
+                            continue
+                        city["seen"].add(poi_id)
+                        fresh.append(poi)
+                    pois = fresh
+                city["count"] += len(pois)
+        if children:
+            self._log(f"{name}「{keyword}」结果数达到接口上限（{total} 条），细分为 {len(children)} 个下级区域查询\n")
+        derived = [(child_code, 1) for _, child_code in children] + [(region_code, page) for page in extra_pages]
+        existing = sum(not self._put_task(0, keyword, adcode, page) for adcode, page in derived)
+        if existing:
+            # 续跑时本页的结果未落盘而重新抓取：派生的页已在队列中（已计入或已完成），不重复计数
+            with self._task_lock:
+                city["pending"] -= existing
+        if pois is not None and not resumed:
+            with self._emit_lock:
+                self.poi_count += len(pois)
+        # 派生的页入队之后再更新本页状态，保证队列中始终能看到未完成的工作
+        if pois is not None and not resumed and self.on_pois is not None:
+            # 下游确认本页结果落盘（done 被调用）前只标记为已抓取：进程在此之间退出时，下次续跑会重新抓取该页
+            self._tasks.fetched(task)
+            # 携带断点信息 (所属城市, 页码, 总数)，由下游与本页 POI 一并持久化
+            self._emit(self.on_pois, keyword, name, region_code, pois, (node["root"], page_num, total),
+                       functools.partial(self._page_done, task))
+        elif pois is not None:
+            # 断点续跑的页已落盘，没有下游时也无需等待
+            self._page_done(task)
+        else:
+            self._settle_page(task)
+
+    def _page_done(self, task):
+        """下游确认一页的结果（连同断点）已落盘：标记该页任务完成。"""
+        self._tasks.complete(task)
+        self._settle_page(task)
+
+    def _settle_page(self, task):
+        """一页已有定论（落盘或最终失败）：所属任务的所有页都有定论后，若均已落盘则清除其任务并触发 on_city_done。"""
+        keyword, region_code, _ = task
+        root = self._nodes[(keyword, region_code)]["root"]
+        city = self._cities[(keyword, root)]
+        with self._task_lock:
+            city["pending"] -= 1
+            finished = city["pending"] == 0
+        # 被停止或出错而中断的任务不标记为已完成，下次可继续查询
+        if finished and not city["failed"]:
+            self._tasks.clear(keyword, root)
+            self._emit(self.on_city_done, keyword, city["region"], root, city["count"])
+
+    def _request_failed(self, text, error):
+        """记录一次请求失败（网络错误或无法解析的响应），失败原因随任务写入队列。"""
+        self._log(f"{text}：{error}\n")
+        _LAST_ERROR.set(str(error))
+
+    def _cached_subdistricts(self, region_code):
+        with self._task_lock:
+            return self._subdistricts.get(region_code)
+
+    def _load_subdistricts(self, name, region_code):
+        """返回 region_code 的下级区域 [(名称, adcode), ...]；失败或被停止返回 None。
+
+        一次请求 subdistrict=2 取得两级下级，孙级直接复用缓存，不再重复请求。
+        """
+        import requests
+
+        children = self._cached_subdistricts(region_code)
+        if children is not None:
+            return children
+        params = {"keywords": region_code, "subdistrict": 2, "extensions": "base"}
+        while True:
+            if not self._should_continue():
+                return None
+            data = self.cache.get(self.DISTRICT_URL, params) if self.cache is not None else None
+            api_key = None
+            if data is None:
+                api_key = self._acquire_key()
+                if api_key is None:
+                    return None
+                try:
+                    response = self._session().get(self.DISTRICT_URL, params={**params, "key": api_key}, timeout=10)
+                    data = response.json()
+                except (requests.RequestException, ValueError) as e:
+                    self._request_failed(f"{name} 行政区划请求失败", e)
+                    return None
+            result = self._district_result(name, region_code, params, api_key, data)
+            if result is not self._RETRY:
+                return result
+
+    def _district_result(self, name, region_code, params, api_key, data):
+        """处理行政区划接口响应：返回下级区域列表；应换 key 重试时返回 _RETRY，失败返回 None。"""
+        if data.get("status") == "0":
+            if self._report_key_error(api_key, data.get("info")):
+                return self._RETRY
+            self._log(f"{name} 行政区划请求失败：{data.get('info')}\n")
+            _LAST_ERROR.set(data.get('info'))
+            return None
+        if api_key is not None and self.cache is not None and data.get("status") == "1":
+            self.cache.put(self.DISTRICT_URL, params, data)
+        tree = parse_subdistricts(data)
+        tree.setdefault(region_code, [])
+        with self._task_lock:
+            for code, children in tree.items():
+                self._subdistricts.setdefault(code, children)
+            return self._subdistricts[region_code]
+
+    def _report_key_error(self, api_key, info):
+        """交给 key 池处理接口错误，返回是否应换 key 重试；key 被停用时经 on_log 记录。"""
+        retry = self.key_pool.report_error(api_key, info)
+        if retry and info not in self.key_pool.QPS_LIMIT_INFOS:
+            self._log(f"key {api_key} 已停用：{info}\n")
+        return retry
+
+    def _place_params(self, keyword, region, region_code, page_num):
+        return {
+            "keywords": keyword,
+            "city": region_code,  # 使用 adcode 值进行查询
+            "offset": self.PAGE_SIZE,
+            "output": "json",
+            "page": page_num,
+        }
+
+    def _fetch_page(self, keyword, region, region_code, page_num):
+        """请求单页，返回 (POI 列表, 首页返回的总数 count)；失败或被停止返回 (None, 0)。
+
+        key 限额/无效等错误交给 key 池处理后换 key 重试同一页。
+        """
+        import requests
+
+        session = self._session()
+        params = self._place_params(keyword, region, region_code, page_num)
+        while True:
+            if not self._should_continue():
+                return None, 0
+            data = self.cache.get(self.PLACE_TEXT_URL, params) if self.cache is not None else None
+            # 缓存命中：不占用 key 配额与限速
+            api_key, status_code = None, 200
+            if data is None:
+                api_key = self._acquire_key()
+                if api_key is None:
+                    return None, 0
+                try:
+                    response = session.get(self.PLACE_TEXT_URL, params={**params, "key": api_key}, timeout=10)
+                    data = response.json()
+                except (requests.RequestException, ValueError) as e:
+                    self._request_failed(f"{region} 第 {page_num} 页请求失败", e)
+                    return None, 0
+                status_code = response.status_code
+            result = self._place_result(region, page_num, params, api_key, status_code, data)
+            if result is not self._RETRY:
+                return result
+
+    def _place_result(self, region, page_num, params, api_key, status_code, data):
+        """处理文本检索响应：返回 (POI 列表, count)；应换 key 重试时返回 _RETRY，失败返回 (None, 0)。"""
+        status_value = data.get('status')
+        status_info = data.get('info')
+        if api_key is not None and self.cache is not None and status_code == 200 and status_value == '1':
+            self.cache.put(self.PLACE_TEXT_URL, params, data)
+        if page_num == 1:
+            start_time = datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+            self._log(f"{start_time} | {region}({params['city']}) — 状态码: {status_code}, 状态: {status_info}\n")
+
+        if status_code == 200 and status_value == '0':
+            # 高德返回状态为 0：通常为限额或 key 问题，交给 key 池处理后换 key 重试同一页
+            if status_info == 'USER_DAILY_QUERY_OVER_LIMIT':
+                self._log("查询已超出每日限制，切换到下一个 key。\n")
+            elif status_info == 'INVALID_USER_KEY':
+                self._log("无效的用户密钥，切换到下一个 key。\n")
+            if self._report_key_error(api_key, status_info):
+                return self._RETRY
+            self._log(f"{region} 查询失败：{status_info}\n")
+            _LAST_ERROR.set(status_info)
+            return None, 0
+
+        if status_value == "1":
+            return data.get("pois", []) or [], int(data.get("count", 0) or 0)
+        # 其他异常状态：视为无数据
+        return [], 0
+
+
+def create_crawl_engine(kind, key_pool, concurrency=64, **kwargs):
+    """按 kind 创建检索引擎：'thread'（默认，线程池）或 'asyncio'（单事件循环，需要可选依赖 aiohttp）。
+
+    asyncio 引擎不可用时抛出 RuntimeError；其余参数与 CrawlEngine 相同。
+    """
+    if kind == 'asyncio':
+        from .async_engine import AsyncCrawlEngine
+        return AsyncCrawlEngine(key_pool, concurrency=concurrency, **kwargs)
+    return CrawlEngine(key_pool, **kwargs)
+
+
+def parse_subdistricts(data, depth=2):
+    """将行政区划接口响应（subdistrict=depth）解析为 {adcode: [(名称, adcode), ...]} 的下级映射。
+
+    最深一层的下级未返回，不记入映射；街道级没有独立 adcode（与所属区县相同），无法作为检索区域，予以忽略。
+    """
+    tree = {}
+
+    def _walk(district, level):
+        code = district.get("adcode")
+        if not code or level >= depth:
+            return
+        children = []
+        for child in district.get("districts", []) or []:
+            child_code = child.get("adcode")
+            if child.get("level") == "street" or not child_code or child_code == code:
+                continue
+            children.append((child.get("name"), child_code))
+            _walk(child, level + 1)
+        tree[code] = children
+
+    for district in data.get("districts", []) or []:
+        _walk(district, 0)
+    return tree
+
+
+def parse_region_tree(provinces):
+    """将行政区划接口返回的省级节点列表（含市、区县两级下级）解析为
+    ConfigManager.update_provinces_data 所需的 (province_to_cities, city_name_to_adcode, city_to_districts)。
+    """
+    province_to_cities = {}
+    city_name_to_adcode = {}
+    city_to_districts = {}
+    for province in provinces:
+        pname = province.get("name")
+        if not pname:
+            continue
+        city_pairs = []
+        for city in province.get("districts", []) or []:
+            cname = city.get("name")
+            ccode = city.get("adcode")
+            if not cname or not ccode:
+                continue
+            city_pairs.append((cname, ccode))
+            city_name_to_adcode[cname] = ccode
+            district_pairs = parse_subdistricts({"districts": [city]}, depth=1).get(ccode)
+            if district_pairs:
+                city_to_districts[ccode] = district_pairs
+        province_to_cities[pname] = city_pairs
+    return province_to_cities, city_name_to_adcode, city_to_districts
+
+
+def split_keywords(text):
+    """将输入框中的关键词按逗号、顿号、分号或换行拆分，去除空白与重复项（保持输入顺序）。"""
+    keywords = (part.strip() for part in re.split(r"[,，、;；\n]+", text or ""))
+    return list(dict.fromkeys(keyword for keyword in keywords if keyword))
+
+
+def poi_to_csv_row(poi, selected_fields):
+    """按所选字段 [(中文名, 英文名), ...] 生成 CSV 行；所有字段均为空时返回 None（整行跳过）。"""
+    row = []
+    all_empty = True
+    for _, english in selected_fields:
+        value = poi.get(english, '')
+        # 将空列表表现形式置空
+        if value == "[]" or (isinstance(value, list) and len(value) == 0):
+            value = ''
+        if value not in (None, '') and english != 'keyword':
+            all_empty = False
+        row.append(value)
+    return None if all_empty else row
+
+
+class CsvSink:
+    """实时导出写入线程：长期持有 CSV 文件，从有界队列取 POI 批量写入（UTF-8 BOM）。
+
+    检索线程只负责 put，磁盘延迟（杀毒扫描、网络盘）不再阻塞抓取；队列满时 put 阻塞形成背压。
+    """
+
+    _STOP = object()
+
+    def __init__(self, path, selected_fields, flush_interval=1.0, max_queue=1000, on_error=None):
+        self.path = path or "realtime_export.csv"
+        self.selected_fields = list(selected_fields)
+        self.flush_interval = max(0.05, float(flush_interval or 1.0))
+        self.on_error = on_error
+        self.rows_written = 0
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue or 1)))
+        self._failed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, pois):
+        """提交一页 POI；写入已失败时直接丢弃。"""
+        if pois and not self._failed:
+            self._queue.put(list(pois))
+
+    def close(self, timeout=None):
+        """写完队列中剩余数据并关闭文件。"""
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _report(self, error):
+        self._failed = True
+        print(f"文件 '{self.path}' 被占用或没有写权限: {error}")
+        if self.on_error is not None:
+            try:
+                self.on_error(self.path, error)
+            except Exception:
+                pass
+
+    def _run(self):
+        import csv
+
+        csvfile = None
+        writer = None
+        try:
+            csvfile = open(self.path, 'a', newline='', encoding='utf-8-sig')
+            writer = csv.writer(csvfile)
+            if csvfile.tell() == 0:
+                writer.writerow([chinese for chinese, _ in self.selected_fields])
+        except OSError as e:
+            self._report(e)
+
+        last_flush = time.monotonic()
+        pending = False
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush)) if pending else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                break
+            if item and writer is not None:
+                # 一次取空队列中已积压的数据，合并为一批写入
+                batch = [item]
+                stop = False
+                while True:
+                    try:
+                        more = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if more is self._STOP:
+                        stop = True
+                        break
+                    batch.append(more)
+                try:
+                    for pois in batch:
+                        for poi in pois:
+                            row = poi_to_csv_row(poi, self.selected_fields)
+                            if row is not None:
+                                writer.writerow(row)
+                                self.rows_written += 1
+                    pending = True
+                except OSError as e:
+                    self._report(e)
+                    writer = None
+                if stop:
+                    break
+            if pending and writer is not None and time.monotonic() - last_flush >= self.flush_interval:
+                try:
+                    csvfile.flush()
+                except OSError as e:
+                    self._report(e)
+                    writer = None
+                last_flush = time.monotonic()
+                pending = False
+
+        if csvfile is not None:
+            try:
+                csvfile.close()
+            except OSError as e:
+                self._report(e)
+
+
+class PoiStore:
+    """SQLite 结果库：POI 到达即写入（WAL 模式、批量事务，以 (POI id, 关键词) 为主键），导出时流式读取。
+
+    同一 POI 被多个关键词命中时每个关键词各保留一行，导出的“关键词”列如实反映命中来源；
+    内存占用与结果总量无关，进程崩溃时已提交的数据也不会丢失（线程安全）。
+    """
+
+    BATCH_ROWS = 500  # 累计达到该行数或距上次提交超过 BATCH_SECONDS 秒即提交一次事务
+    BATCH_SECONDS = 1.0
+    CHECKPOINT_TTL_DAYS = 7  # 超过该天数未续跑的页断点视为过期，对应区域重新从第 1 页抓取
+
+    def __init__(self, path='results.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                keyword TEXT,
+                started_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS pois (
+                id TEXT NOT NULL,
+                run_id INTEGER,
+                keyword TEXT NOT NULL DEFAULT '',
+                adcode TEXT,
+                data TEXT NOT NULL,
+                fetched_at TEXT,
+                PRIMARY KEY (id, keyword)
+            );
+            CREATE TABLE IF NOT EXISTS page_checkpoints (
+                keyword TEXT NOT NULL,
+                adcode TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                root TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                run_id INTEGER,
+                fetched_at TEXT,
+                PRIMARY KEY (keyword, adcode, page)
+            );
+        """)
+        self._migrate_poi_key()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pois_run ON pois(run_id)")
+        self._conn.commit()
+        self._pending = []
+        self._pending_checkpoints = []
+        self._pending_runs = {}  # 未提交 POI 的 (键, 关键词) -> run_id，供去重查询
+        self._on_commit = []  # 本批提交后再执行的回调（如交给实时导出、确认页已落盘）
+        self._committed = []  # 已提交、待在锁外执行的回调
+        self._last_commit = time.monotonic()
+        self.duplicates = 0  # 累计跳过的重复 POI 条数
+
+    def _migrate_poi_key(self):
+        """旧版结果库以 id 单独为主键：迁移为 (id, 关键词) 主键，保留原有行与写入顺序。"""
+        # table_info 的第 6 列为该列在主键中的序号（0 表示不属于主键）
+        primary_key = [name for _, name, _, _, _, pk in self._conn.execute("PRAGMA table_info(pois)") if pk]
+        if primary_key != ["id"]:
+            return
+        with self._conn:
+            self._conn.execute("DROP INDEX IF EXISTS idx_pois_run")
+            self._conn.execute("ALTER TABLE pois RENAME TO pois_old")
+            self._conn.execute("""
+                CREATE TABLE pois (
+                    id TEXT NOT NULL,
+                    run_id INTEGER,
+                    keyword TEXT NOT NULL DEFAULT '',
+                    adcode TEXT,
+                    data TEXT NOT NULL,
+                    fetched_at TEXT,
+                    PRIMARY KEY (id, keyword)
+                )""")
+            self._conn.execute(
+                "INSERT INTO pois (id, run_id, keyword, adcode, data, fetched_at) "
+                "SELECT id, run_id, COALESCE(keyword, ''), adcode, data, fetched_at FROM pois_old ORDER BY rowid")
+            self._conn.execute("DROP TABLE pois_old")
+
+    @staticmethod
+    def poi_key(poi):
+        """POI 的唯一键：优先使用高德 id，缺失时退回到名称+坐标。"""
+        poi_id = poi.get('id')
+        if poi_id:
+            return str(poi_id)
+        return f"{poi.get('name', '')}|{poi.get('location', '')}"
+
+    def begin_run(self, keyword):
+        """登记一轮新的检索，返回 run_id。"""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO runs (keyword, started_at) VALUES (?, ?)",
+                (keyword, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def add(self, run_id, keyword, adcode, pois, dedup='run', cursor=None, on_commit=None):
+        """写入一页 POI，返回其中此前未出现过的部分（只有这部分需要显示与导出）。
+
+        dedup 决定“出现过”的范围：'run' 为本轮内（跨城市去重），'history' 为结果库全部历史，
+        'off' 不去重（同一关键词下的同一 POI 只保留最新一行）。去重按 (POI id, 关键词) 判断：
+        不同关键词命中的同一 POI 各自保留；重复的 POI 不再写入，以便历史去重时保留其首次出现的轮次。
+        cursor=(所属城市 adcode, 页码, 总数) 时同时记录该页的断点，与本页 POI 进入同一批事务。
+        on_commit(fresh) 在本页所在的批次提交后（于锁外）调用，即使本页没有新 POI：实时导出经此写入，
+        保证导出的行及其断点都已落盘，续跑时不会重复写入 CSV；引擎也经此得知该页可以标记为已完成。
+        """
+        fetched_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        keys = [self.poi_key(poi) for poi in pois]
+        fresh = []
+        with self._lock:
+            seen = self._seen_keys(keys, keyword, run_id, dedup)
+            for key, poi in zip(keys, pois):
+                if key in seen:
+                    self.duplicates += 1
+                    continue
+                if dedup != 'off':
+                    seen.add(key)  # 同一页内的重复
+                fresh.append(poi)
+                self._pending.append((key, run_id, keyword, adcode, json.dumps(poi, ensure_ascii=False), fetched_at))
+                self._pending_runs[(key, keyword)] = run_id
+            if cursor is not None:
+                root, page, total = cursor
+                self._pending_checkpoints.append((keyword, adcode, page, root, total, run_id, fetched_at))
+            if on_commit is not None:
+                self._on_commit.append((on_commit, fresh))
+            if len(self._pending) >= self.BATCH_ROWS or time.monotonic() - self._last_commit >= self.BATCH_SECONDS:
+                self._commit()
+        self._run_committed()
+        return fresh
+
+    def load_checkpoints(self, jobs):
+        """返回当前任务 [(关键词, 区域 adcode), ...] 已完成页的断点 {(关键词, adcode, 页码): 总数}，供引擎跳过这些页。
+
+        只取与当前任务的 (关键词, 区域) 匹配的断点，其他区域遗留的断点不受影响。
+        """
+        jobs = set(jobs)
+        with self._lock:
+            rows = self._conn.execute("SELECT keyword, adcode, page, root, total FROM page_checkpoints").fetchall()
+        return {(keyword, adcode, page): total for keyword, adcode, page, root, total in rows
+                if (keyword, root) in jobs}
+
+    def clear_checkpoints(self, keyword, root):
+        """城市（含其下钻区县）全部完成后清除其断点（查询状态已记入配置）。"""
+        with self._lock:
+            self._commit()
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM page_checkpoints WHERE keyword = ? AND (root = ? OR adcode = ?)",
+                    (keyword, root, root))
+        self._run_committed()
+
+    def resumable_run(self, jobs):
+        """若当前任务 [(关键词, 区域 adcode), ...] 中有上次中断留下的断点，返回其所属的 run_id。
+
+        续跑时沿用该轮次，保证去重与导出覆盖中断前的结果；只看与当前任务匹配且未过期的断点，
+        其他区域遗留的断点不会让无关的检索沿用旧轮次。
+        """
+        jobs = set(jobs)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT keyword, root, run_id FROM page_checkpoints WHERE fetched_at >= ?",
+                (self._checkpoint_cutoff(),)).fetchall()
+        run_ids = [run_id for keyword, root, run_id in rows if (keyword, root) in jobs]
+        return max(run_ids) if run_ids else None
+
+    def discard_stale_checkpoints(self, jobs, run_id):
+        """清除不能沿用到 run_id 这一轮的断点，返回被清除的 [(关键词, 区域 adcode), ...]。
+
+        包括当前任务中属于其他轮次的断点，以及超过 CHECKPOINT_TTL_DAYS 天未续跑的断点；
+        这些区域下次从第 1 页重新抓取，调用方应同时清除它们在任务队列中的记录。
+        """
+        jobs = set(jobs)
+        cutoff = self._checkpoint_cutoff()
+        with self._lock:
+            self._commit()
+            rows = self._conn.execute(
+                "SELECT DISTINCT keyword, root, run_id, fetched_at < ? FROM page_checkpoints", (cutoff,)).fetchall()
+            stale = sorted({(keyword, root) for keyword, root, row_run, expired in rows
+                            if expired or ((keyword, root) in jobs and row_run != run_id)})
+            if stale:
+                with self._conn:
+                    self._conn.executemany(
+                        "DELETE FROM page_checkpoints WHERE keyword = ? AND root = ?", stale)
+        self._run_committed()
+        return stale
+
+    def _checkpoint_cutoff(self):
+        return (datetime.now() - timedelta(days=self.CHECKPOINT_TTL_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def _seen_keys(self, keys, keyword, run_id, dedup):
+        """返回 keys 中在该关键词下按 dedup 范围已出现过的键（先查未提交缓冲，再按主键查库；调用方持有锁）。"""
+        if dedup == 'off' or not keys:
+            return set()
+        found = dict((key, self._pending_runs[(key, keyword)]) for key in keys if (key, keyword) in self._pending_runs)
+        rest = [key for key in keys if key not in found]
+        if rest:
+            placeholders = ",".join("?" * len(rest))
+            for key, row_run in self._conn.execute(
+                    f"SELECT id, run_id FROM pois WHERE keyword = ? AND id IN ({placeholders})", [keyword, *rest]):
+                found[key] = row_run
+        if dedup == 'history':
+            return set(found)
+        return {key for key, row_run in found.items() if row_run == run_id}
+
+    def _commit(self):
+        """提交累积的写入（POI 与页断点在同一事务中，调用方持有锁）。"""
+        if self._pending or self._pending_checkpoints:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO pois (id, run_id, keyword, adcode, data, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", self._pending)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO page_checkpoints (keyword, adcode, page, root, total, run_id, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending_checkpoints)
+            self._pending = []
+            self._pending_runs = {}
+            self._pending_checkpoints = []
+        self._last_commit = time.monotonic()
+        self._committed.extend(self._on_commit)
+        self._on_commit = []
+
+    def _run_committed(self):
+        """执行已提交批次的回调（不持有锁：回调可能再次写入结果库或清除断点）。"""
+        with self._lock:
+            callbacks, self._committed = self._committed, []
+        for callback, fresh in callbacks:
+            try:
+                callback(fresh)
+            except Exception as e:
+                print(f"结果提交回调执行失败: {e}", file=sys.stderr)
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+        self._run_committed()
+
+    def count(self, run_id=None):
+        """返回指定轮次（缺省为全部）的 POI 数量。"""
+        self.flush()
+        with self._lock:
+            if run_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM pois").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM pois WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+    def iter_pois(self, run_id=None, batch_size=1000, with_keyword=False):
+        """按写入顺序流式读取 POI（使用独立的只读连接，不阻塞写入）。
+
+        with_keyword=True 时在每条 POI 中附上命中它的检索关键词（键 "keyword"）。
+        """
+        self.flush()
+        conn = sqlite3.connect(self.path)
+        try:
+            if run_id is None:
+                cur = conn.execute("SELECT keyword, data FROM pois ORDER BY rowid")
+            else:
+                cur = conn.execute("SELECT keyword, data FROM pois WHERE run_id = ? ORDER BY rowid", (run_id,))
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for keyword, data in rows:
+                    poi = json.loads(data)
+                    if with_keyword:
+                        poi["keyword"] = keyword
+                    yield poi
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+        self._run_committed()
+
+
+class TaskQueue:
+    """持久化页任务队列（SQLite）：以 (关键词, adcode, 页码) 为单位记录状态、尝试次数与下次可执行时间。
+
+    工作线程通过 lease 领取到期的任务，失败的任务按指数退避重新排队，超过最大尝试次数后标记为 failed
+    并保留在库中；进程退出后未完成与失败的任务都不会丢失，下次检索同一区域时从中断处继续（线程安全）。
+    抓取成功的页先标记为 fetched（已交给下游），下游确认其结果落盘后才标记为 done；
+    进程在两者之间退出时，fetched 的任务与 leased 一样放回待执行。
+    """
+
+    PENDING, LEASED, FETCHED, DONE, FAILED = 'pending', 'leased', 'fetched', 'done', 'failed'
+
+    def __init__(self, path='task_queue.db', max_attempts=5, base_delay=2.0, max_delay=300.0, lease_seconds=300.0):
+        self.path = path
+        self.max_attempts = max(1, int(max_attempts or 1))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.lease_seconds = float(lease_seconds)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                keyword TEXT NOT NULL,
+                adcode TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                name TEXT,
+                root TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 1,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_eligible REAL NOT NULL DEFAULT 0,
+                lease_expires REAL,
+                last_error TEXT,
+                run_token TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (keyword, adcode, page)
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_run ON tasks (run_token, state, priority, next_eligible);
+            CREATE INDEX IF NOT EXISTS idx_tasks_root ON tasks (keyword, root);
+        """)
+        with self._conn:
+            # 上次进程退出时仍被领取、或结果尚未落盘的任务已无人处理，直接放回待执行
+            self._conn.execute("UPDATE tasks SET state = ?, lease_expires = NULL WHERE state IN (?, ?)",
+                               (self.PENDING, self.LEASED, self.FETCHED))
+
+    @staticmethod
+    def _now_text():
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def open_job(self, run_token, keyword, root, name):
+        """登记一个 (关键词, 区域) 任务到本轮 run_token，返回其未完成的页任务 [(adcode, 页码, 名称), ...]。
+
+        该区域有上次留下的未完成或失败的任务时沿用（失败与结果未落盘的任务重新排队，失败的尝试次数清零），
+        否则清除旧记录并从第 1 页开始。
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT adcode, page, name FROM tasks WHERE keyword = ? AND root = ? AND state != ?",
+                (keyword, root, self.DONE)).fetchall()
+            if rows:
+                self._conn.execute(
+                    "UPDATE tasks SET run_token = ?, state = CASE WHEN state IN (?, ?) THEN ? ELSE state END, "
+                    "attempts = CASE WHEN state = ? THEN 0 ELSE attempts END, next_eligible = 0 "
+                    "WHERE keyword = ? AND root = ?",
+                    (run_token, self.FAILED, self.FETCHED, self.PENDING, self.FAILED, keyword, root))
+                return rows
+            self._conn.execute("DELETE FROM tasks WHERE keyword = ? AND root = ?", (keyword, root))
+            self._conn.execute(
+                "INSERT INTO tasks (keyword, adcode, page, name, root, priority, state, run_token, updated_at) "
+                "VALUES (?, ?, 1, ?, ?, 1, ?, ?, ?)",
+                (keyword, root, name, root, self.PENDING, run_token, self._now_text()))
+            return [(root, 1, name)]
+
+    def enqueue(self, run_token, keyword, adcode, page, name, root, priority=0):
+        """加入一个页任务并返回是否为新任务；已存在（含已完成）的任务保持原状态，不重复抓取。"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "INSERT OR IGNORE INTO tasks (keyword, adcode, page, name, root, priority, state, run_token, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (keyword, adcode, page, name, root, priority, self.PENDING, run_token, self._now_text())).rowcount == 1
+
+    def lease(self, run_token):
+        """领取本轮一个已到期的任务（优先级小的先领，租约过期的任务可被重新领取），
+        返回 (关键词, adcode, 页码)；暂无可领取的任务时返回 None。"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT keyword, adcode, page FROM tasks WHERE run_token = ? AND "
+                "((state = ? AND next_eligible <= ?) OR (state = ? AND lease_expires < ?)) "
+                "ORDER BY priority, next_eligible, rowid LIMIT 1",
+                (run_token, self.PENDING, now, self.LEASED, now)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, lease_expires = ?, updated_at = ? "
+                "WHERE keyword = ? AND adcode = ? AND page = ?",
+                (self.LEASED, now + self.lease_seconds, self._now_text(), *row))
+            return row
+
+    def outstanding(self, run_token):
+        """返回本轮尚未完成的任务数（待执行与已领取）及距最早一个待执行任务到期的秒数。"""
+        with self._lock:
+            count, earliest = self._conn.execute(
+                "SELECT COUNT(*), MIN(CASE WHEN state = ? THEN next_eligible END) FROM tasks "
+                "WHERE run_token = ? AND state IN (?, ?)",
+                (self.PENDING, run_token, self.PENDING, self.LEASED)).fetchone()
+        wait = max(0.0, earliest - time.time()) if earliest is not None else 0.0
+        return count, wait
+
+    def fetched(self, task):
+        """任务已抓取并交给下游：不再计入未完成数，等待下游确认结果落盘后再 complete。"""
+        self._set_state(task, self.FETCHED)
+
+    def complete(self, task):
+        """任务结果已落盘：标记为已完成。"""
+        self._set_state(task, self.DONE)
+
+    def release(self, task):
+        """任务被停止而未执行完：放回待执行，不计入尝试次数。"""
+        self._set_state(task, self.PENDING)
+
+    def fail(self, task, error=None):
+        """任务失败：按指数退避重新排队并返回等待秒数；超过最大尝试次数时标记为 failed 并返回 None。"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT attempts FROM tasks WHERE keyword = ? AND adcode = ? AND page = ?", task).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            if attempts >= self.max_attempts:
+                state, delay = self.FAILED, None
+            else:
+                state, delay = self.PENDING, min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, attempts = ?, next_eligible = ?, lease_expires = NULL, "
+                "last_error = ?, updated_at = ? WHERE keyword = ? AND adcode = ? AND page = ?",
+                (state, attempts, time.time() + (delay or 0), str(error or '')[:200], self._now_text(), *task))
+        return delay
+
+    def _set_state(self, task, state):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE keyword = ? AND adcode = ? AND page = ?",
+                (state, self._now_text(), *task))
+
+    def clear(self, keyword, root):
+        """区域（含其下钻区县）全部完成后清除其任务记录。"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tasks WHERE keyword = ? AND root = ?", (keyword, root))
+
+    def failed_tasks(self, run_token):
+        """本轮最终失败的任务 [(关键词, 名称, adcode, 页码, 尝试次数, 错误), ...]。"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT keyword, name, adcode, page, attempts, last_error FROM tasks "
+                "WHERE run_token = ? AND state = ? ORDER BY rowid",
+                (run_token, self.FAILED)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """接口响应磁盘缓存（SQLite）：按 (接口, 关键词, 城市 adcode, 页码, 每页条数等参数) 缓存成功的响应。
+
+    崩溃后重跑、重置状态后重查或定时重复采集时，TTL 内的相同请求直接读缓存，不再消耗配额。
+    条目超过 max_entries 时按写入时间淘汰最旧的一批（线程安全）。
+    """
+
+    def __init__(self, path='response_cache.db', ttl_seconds=24 * 3600, max_entries=50000):
+        self.path = path
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries or 1))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """缓存键：接口地址 + 除 key 以外的全部请求参数（排序后拼接）。"""
+        parts = [f"{name}={params[name]}" for name in sorted(params) if name != 'key']
+        return endpoint + "?" + "&".join(parts)
+
+    def get(self, endpoint, params):
+        """返回 TTL 内的缓存响应（dict）；未命中返回 None。"""
+        cache_key = self.make_key(endpoint, params)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, created_at FROM responses WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, endpoint, params, data):
+        """写入一条成功的响应；每写入一定数量检查一次容量并淘汰最旧的条目。"""
+        cache_key = self.make_key(endpoint, params)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (cache_key, data, created_at) VALUES (?, ?, ?)",
+                    (cache_key, json.dumps(data, ensure_ascii=False), time.time()))
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict()
+
+    def _evict(self):
+        """删除过期条目，并在超出容量时淘汰最旧的条目至容量的 90%（调用方持有锁）。"""
+        with self._conn:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            total = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if total > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE cache_key IN "
+                    "(SELECT cache_key FROM responses ORDER BY created_at LIMIT ?)",
+                    (total - int(self.max_entries * 0.9),))
+
+    def summary(self):
+        return f"响应缓存：命中 {self.hits} 次，未命中 {self.misses} 次"
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._conn.close()